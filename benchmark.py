@@ -0,0 +1,453 @@
+"""
+CalmCafe 데이터 분석 서버 벤치마크
+
+현재 데이터와 같은 스키마(한글 주소 포함)의 합성 데이터를 1배, 100배, 10,000배 크기로 만들고
+각 API(Flask 테스트 클라이언트)와 데이터/차트 생성 함수를 직접 호출해
+지연 시간 백분위수, 최대 메모리, 처리량을 측정합니다.
+마지막으로 즐겨찾기/설문 추가 이벤트로 증분 갱신한 상태가 CSV 전체로 다시 만든 상태와 같은지 확인합니다.
+
+사용 예:
+    python benchmark.py                       # 1x, 100x, 10000x
+    python benchmark.py --scales 1 100 --iterations 50 --json bench.json
+    python benchmark.py --remote-ranking      # 랭킹을 로컬 HTTP 서버에서 가져오는 분리 배포 모드 포함
+
+인터넷 연결 없이 동작하며, 분리 배포 모드의 랭킹 API는 같은 앱을 127.0.0.1에 띄워 대신합니다.
+각 배율은 별도 프로세스에서 실행되어 캐시와 메모리 측정이 서로 섞이지 않습니다.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 대시보드 기본 카페 id (dataAnalysis.TARGET_STORE_ID와 같음)
+TARGET_STORE_ID = 291
+
+# 합성 데이터 지역: (도/특별시, 시/구, 중심 위도, 중심 경도)
+REGIONS = [
+    ('경기도', '고양시', 37.658, 126.832),
+    ('경기도', '수원시', 37.263, 127.028),
+    ('경기도', '성남시', 37.420, 127.126),
+    ('서울특별시', '마포구', 37.566, 126.901),
+    ('서울특별시', '강남구', 37.517, 127.047),
+    ('서울특별시', '성북구', 37.589, 127.016),
+    ('인천광역시', '남동구', 37.447, 126.731),
+    ('부산광역시', '해운대구', 35.163, 129.163),
+    ('대구광역시', '중구', 35.869, 128.606),
+    ('광주광역시', '서구', 35.152, 126.890),
+    ('대전광역시', '유성구', 36.362, 127.356),
+    ('강원특별자치도', '춘천시', 37.881, 127.729),
+    ('세종특별자치시', '조치원읍', 36.600, 127.298),
+    ('제주특별자치도', '제주시', 33.499, 126.531),
+]
+ROADS = ['중앙로', '항공대학로', '화랑로', '흥도로', '테헤란로', '해운대로', '대학로', '시청로']
+NAME_PREFIXES = ['카페', 'Cafe', '커피', 'Coffee', '스타벅스', '블루팟', '빵다방']
+MENUS = ['Americano', 'VanillaLatte', 'CafeLatte', 'IcedTea', 'MangoSmootie']
+MENU_WEIGHTS = [0.56, 0.18, 0.13, 0.07, 0.06]
+VISIT_FREQUENCIES = ['주 1회', '주 3회', '매일', '월 1회']
+FACILITIES = ['분위기', '가격', '맛', '위치']
+WEEKDAYS = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+HOURS = list(range(9, 22))
+
+STORE_COLUMNS = [
+    'id', 'created_at', 'updated_at', 'address', 'closing_time', 'current_customer_count', 'favorite_count',
+    'last_order_time', 'latitude', 'longitude', 'max_customer_count', 'name', 'opening_time',
+    'store_congestion_level', 'store_congestion_value', 'user_congestion_input_time', 'user_congestion_level',
+    'user_congestion_value', 'user_id', 'image',
+]
+SURVEY_COLUMNS = [
+    'id', 'created_at', 'updated_at', 'age', 'cafe_choose_cause', 'cafe_using_purpose', 'cafe_visited_frequency',
+    'convenience_facility_prefer', 'favorite_menu', 'gender', 'hobby', 'is_usingsns', 'job', 'location',
+    'marriage', 'user_id',
+]
+
+
+def base_sizes():
+    """
+    현재 저장소 데이터의 행 수 (1배 기준)
+    """
+    return {
+        'stores': len(pd.read_csv(os.path.join(BASE_DIR, 'store(통합).csv'), usecols=['id'])),
+        'favorites': len(pd.read_csv(os.path.join(BASE_DIR, 'store_favorite.csv'), usecols=['store_id'])),
+        'users': len(pd.read_csv(os.path.join(BASE_DIR, 'survey.csv'), usecols=['user_id'])),
+        'congestion_stores': 1,
+    }
+
+
+def random_timestamps(rng, size):
+    """
+    2024년 10~11월 사이 임의 시각 문자열 (store(통합).csv 형식)
+    """
+    start = np.datetime64('2024-10-01T00:00:00')
+    offsets = rng.integers(0, 60 * 60 * 24 * 60, size=size).astype('timedelta64[s]')
+    return pd.Series(start + offsets).dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def generate_dataset(output_dir, scale, seed=0):
+    """
+    scale배 크기의 합성 데이터를 output_dir에 저장 (store(통합).csv, store_favorite.csv, survey.csv, congestion.csv)
+    """
+    rng = np.random.default_rng(seed)
+    sizes = {name: max(1, int(count * scale)) for name, count in base_sizes().items()}
+    n_stores, n_favorites, n_users = sizes['stores'], sizes['favorites'], sizes['users']
+
+    # 카페: 대시보드 기본 카페 id가 항상 포함되도록 함
+    store_ids = np.arange(1, n_stores + 1)
+    if TARGET_STORE_ID not in store_ids:
+        store_ids[-1] = TARGET_STORE_ID
+    region = rng.integers(0, len(REGIONS), size=n_stores)
+    region_table = pd.DataFrame(REGIONS, columns=['province', 'city', 'lat', 'lon'])
+    region_rows = region_table.iloc[region].reset_index(drop=True)
+    roads = np.array(ROADS)[rng.integers(0, len(ROADS), size=n_stores)]
+    numbers = rng.integers(1, 500, size=n_stores)
+    opening_hours = rng.integers(7, 11, size=n_stores)
+    closing_hours = rng.integers(20, 24, size=n_stores)
+    max_customers = rng.integers(20, 120, size=n_stores)
+    current_customers = (max_customers * rng.random(n_stores)).astype(int)
+    congestion_value = (current_customers * 100 // max_customers).astype(int)
+
+    stores = pd.DataFrame({
+        'id': store_ids,
+        'created_at': random_timestamps(rng, n_stores),
+        'updated_at': random_timestamps(rng, n_stores),
+        'address': region_rows['province'] + ' ' + region_rows['city'] + ' ' + roads + ' ' + numbers.astype(str),
+        'closing_time': pd.Series(closing_hours).astype(str) + ':00:00',
+        'current_customer_count': current_customers,
+        'favorite_count': 0,
+        'last_order_time': pd.Series(closing_hours - 1).astype(str) + ':30:00',
+        'latitude': region_rows['lat'] + rng.normal(0, 0.03, size=n_stores),
+        'longitude': region_rows['lon'] + rng.normal(0, 0.03, size=n_stores),
+        'max_customer_count': max_customers,
+        'name': pd.Series(np.array(NAME_PREFIXES)[rng.integers(0, len(NAME_PREFIXES), size=n_stores)])
+        + '_' + pd.Series(store_ids).astype(str),
+        'opening_time': pd.Series(opening_hours).astype(str) + ':00:00',
+        'store_congestion_level': np.minimum(congestion_value // 34, 2),
+        'store_congestion_value': congestion_value,
+        'user_congestion_input_time': random_timestamps(rng, n_stores),
+        'user_congestion_level': rng.integers(0, 3, size=n_stores),
+        'user_congestion_value': rng.integers(0, 101, size=n_stores),
+        'user_id': rng.integers(1, n_users + 1, size=n_stores),
+        'image': np.nan,
+    })[STORE_COLUMNS]
+    # 기본 카페는 경기도 고양시에 둠 (경기도 랭킹과 주변 카페 차트에 포함되도록)
+    target_row = stores['id'] == TARGET_STORE_ID
+    stores.loc[target_row, 'address'] = '경기도 고양시 덕양구 화랑로 59 1층'
+    stores.loc[target_row, ['latitude', 'longitude']] = [37.6004, 126.8681]
+
+    # 설문: user_id 1..n_users
+    survey = pd.DataFrame({
+        'id': np.nan,
+        'created_at': np.nan,
+        'updated_at': np.nan,
+        'age': rng.integers(15, 66, size=n_users),
+        'cafe_choose_cause': np.nan,
+        'cafe_using_purpose': np.nan,
+        'cafe_visited_frequency': rng.choice(VISIT_FREQUENCIES, size=n_users),
+        'convenience_facility_prefer': rng.choice(FACILITIES, size=n_users),
+        'favorite_menu': rng.choice(MENUS, size=n_users, p=MENU_WEIGHTS),
+        'gender': rng.choice(['남', '여'], size=n_users),
+        'hobby': np.nan,
+        'is_usingsns': np.nan,
+        'job': np.nan,
+        'location': np.nan,
+        'marriage': rng.choice(['O', 'X'], size=n_users),
+        'user_id': np.arange(1, n_users + 1),
+    })[SURVEY_COLUMNS]
+
+    # 즐겨찾기: 인기 카페에 몰리는 분포 (순위 k의 가중치 ~ 1/k), 기본 카페는 가장 인기 있게
+    popularity = rng.permutation(store_ids)
+    popularity = np.concatenate([[TARGET_STORE_ID], popularity[popularity != TARGET_STORE_ID]])
+    weights = 1.0 / np.arange(1, n_stores + 1)
+    favorites = pd.DataFrame({
+        'id': np.nan,
+        'store_id': rng.choice(popularity, size=n_favorites, p=weights / weights.sum()),
+        'user_id': rng.integers(1, n_users + 1, size=n_favorites),
+    })
+
+    # 예측 혼잡도: 기본 카페 + 임의 카페들, 요일 x 9~21시
+    n_congestion = min(sizes['congestion_stores'], n_stores)
+    congestion_ids = np.concatenate([
+        [TARGET_STORE_ID],
+        rng.choice(store_ids[store_ids != TARGET_STORE_ID], size=n_congestion - 1, replace=False),
+    ])
+    grid = pd.MultiIndex.from_product(
+        [congestion_ids, WEEKDAYS, HOURS], names=['store_id', 'weekday', 'hour']
+    ).to_frame(index=False)
+    peak = np.exp(-((grid['hour'].to_numpy() - 14) ** 2) / 18.0)
+    grid['predicted_people'] = rng.poisson(2 + 9 * peak)
+
+    os.makedirs(output_dir, exist_ok=True)
+    stores.to_csv(os.path.join(output_dir, 'store(통합).csv'), index=False, encoding='utf-8-sig')
+    favorites.to_csv(os.path.join(output_dir, 'store_favorite.csv'), index=False, encoding='utf-8-sig')
+    survey.to_csv(os.path.join(output_dir, 'survey.csv'), index=False, encoding='utf-8-sig')
+    grid.to_csv(os.path.join(output_dir, 'congestion.csv'), index=False)
+    return {'stores': n_stores, 'favorites': n_favorites, 'users': n_users, 'congestion_rows': len(grid)}
+
+
+def percentile(sorted_values, q):
+    """
+    정렬된 값 목록의 q 백분위수 (선형 보간)
+    """
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def measure(fn, iterations):
+    """
+    첫 호출(cold)과 이후 iterations번 호출의 지연 시간, 처리량, 최대 메모리 측정
+    """
+    start = time.perf_counter()
+    fn()
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    total_start = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    total = time.perf_counter() - total_start
+
+    # 메모리는 별도 호출에서 측정 (tracemalloc이 지연 시간을 왜곡하지 않도록)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'cold_ms': round(cold_ms, 3),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p90_ms': round(percentile(latencies, 90), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'throughput_per_s': round(iterations / total, 2) if total else None,
+        'peak_alloc_mb': round(peak / 1024 / 1024, 3),
+    }
+
+
+def start_ranking_server(app):
+    """
+    분리 배포 모드용 로컬 랭킹 API 서버 (BASE_URL 대신 127.0.0.1 임의 포트)
+    """
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/api/gyeonggi-favorites"
+
+
+def expect_ok(response):
+    """
+    벤치마크 중 응답 오류는 조용히 넘기지 않음
+    """
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.path} -> {response.status_code}: {response.get_data(as_text=True)}")
+    return response
+
+
+def check_incremental(dataAnalysis, client):
+    """
+    즐겨찾기/설문 추가 이벤트로 증분 갱신한 상태가 CSV 전체로 다시 만든 상태와 같은지 확인
+    (새 선호 메뉴 값, 프로필 교체, 설문이 나중에 들어온 사용자의 즐겨찾기 포함, 다르면 RuntimeError)
+    반환값: 반영한 이벤트 수
+    """
+    target = dataAnalysis.TARGET_STORE_ID
+    stores = [target, *dataAnalysis.query_favorites_ranking()['store_id'].head(2).tolist()]
+    user = int(dataAnalysis.get_id_index()['user_ids'].max()) + 1
+    events = [
+        ('/api/survey', {'user_id': user, 'gender': '남', 'age': 25, 'favorite_menu': 'ZuluBlend'}),
+        ('/api/favorites', {'store_id': target, 'user_id': user}),
+        ('/api/favorites', {'store_id': stores[1], 'user_id': user + 1}),
+        ('/api/survey', {'user_id': user + 1, 'gender': '여', 'age': 41, 'favorite_menu': 'AlphaBrew'}),
+        ('/api/survey', {'user_id': user, 'gender': '여', 'favorite_menu': 'AlphaBrew'}),
+        ('/api/favorites', {'store_id': stores[2], 'user_id': user}),
+    ]
+
+    def state():
+        distributions, _ = dataAnalysis.store_distributions(stores)
+        return {
+            'profiles': [expect_ok(client.get(f'/api/stores/{store_id}/profile')).get_json() for store_id in stores],
+            'ranking': expect_ok(client.get('/api/favorites-ranking')).get_data(as_text=True),
+            'distributions': {
+                store_id: [list(counts.items()) for counts in distribution]
+                for store_id, distribution in distributions.items()
+            },
+            'tables': {
+                key: dataAnalysis.favorites_demographic_table(key).to_dict(orient='split')
+                for key in ('gender_by_store', 'age_by_store', 'menu_by_store')
+            },
+            'demographics': list(dataAnalysis.favorites_demographics().items()),
+        }
+
+    applied = dataAnalysis.metrics_snapshot()['counters'].get('favorites_delta_applied', 0)
+    for path, body in events:
+        expect_ok(client.post(path, json=body))
+    applied = dataAnalysis.metrics_snapshot()['counters'].get('favorites_delta_applied', 0) - applied
+    if applied != len(events):
+        raise RuntimeError(f"증분 반영 {applied}/{len(events)}건 (나머지는 인덱스를 다시 생성)")
+
+    incremental = state()
+    dataAnalysis.clear_favorites_indexes()
+    rebuilt = state()
+    mismatched = [key for key in incremental if incremental[key] != rebuilt[key]]
+    if mismatched:
+        raise RuntimeError(f"증분 갱신 상태가 다시 만든 상태와 다름: {', '.join(mismatched)}")
+    return len(events)
+
+
+def run_scale(iterations, remote_ranking):
+    """
+    DATA_DIR/STATIC_DIR 환경 변수가 가리키는 데이터로 모든 케이스를 측정 (자식 프로세스에서 실행)
+    """
+    sys.path.insert(0, BASE_DIR)
+    import dataAnalysis
+
+    client = dataAnalysis.app.test_client()
+    chart_path = os.path.join(dataAnalysis.STATIC_FOLDER, 'benchmark_chart.png')
+    target = dataAnalysis.TARGET_STORE_ID
+    lat, lon = 37.6004, 126.8681
+
+    cases = [
+        ('endpoint', 'GET /api/gyeonggi-favorites', lambda: expect_ok(client.get('/api/gyeonggi-favorites'))),
+        ('endpoint', 'GET /api/gyeonggi-favorites-image', lambda: expect_ok(client.get('/api/gyeonggi-favorites-image'))),
+        ('endpoint', 'GET /api/favorites-ranking?province=경기도',
+         lambda: expect_ok(client.get('/api/favorites-ranking', query_string={'province': '경기도'}))),
+        ('endpoint', 'GET /api/get-calmcafe-data-image', lambda: expect_ok(client.get('/api/get-calmcafe-data-image'))),
+        ('endpoint', f'GET /api/stores/{target}/congestion',
+         lambda: expect_ok(client.get(f'/api/stores/{target}/congestion'))),
+        ('endpoint', 'GET /api/nearby (2km)',
+         lambda: expect_ok(client.get('/api/nearby', query_string={'lat': lat, 'lon': lon, 'radius': 2}))),
+        ('function', 'query_gyeonggi_favorites', dataAnalysis.query_gyeonggi_favorites),
+        ('function', 'gender_distribution_data', dataAnalysis.gender_distribution_data),
+        ('function', 'age_distribution_data', dataAnalysis.age_distribution_data),
+        ('function', 'congestion_summary_data', dataAnalysis.congestion_summary_data),
+        ('function', 'target_store_distributions', lambda: dataAnalysis.target_store_distributions(target)),
+        ('function', 'query_nearby_stores (2km)', lambda: dataAnalysis.query_nearby_stores(lat, lon, 2)),
+        ('function', 'generate_gender_distribution_image',
+         lambda: dataAnalysis.generate_gender_distribution_image(chart_path)),
+        ('function', 'generate_age_distribution_image',
+         lambda: dataAnalysis.generate_age_distribution_image(chart_path)),
+        ('function', 'generate_busiest_and_least_busy_times', dataAnalysis.generate_busiest_and_least_busy_times),
+        ('function', 'visualize_favorites_by_store', dataAnalysis.visualize_favorites_by_store),
+        ('function', 'build_favorites_index (rebuild)', dataAnalysis.build_favorites_index),
+    ]
+
+    results = []
+    for kind, name, fn in cases:
+        results.append({'kind': kind, 'name': name, **measure(fn, iterations)})
+
+    if remote_ranking:
+        server, ranking_url = start_ranking_server(dataAnalysis.app)
+        try:
+            dataAnalysis.RANKING_API_URL = ranking_url
+            for name, fn in (
+                ('gender_distribution_data [remote ranking]', dataAnalysis.gender_distribution_data),
+                ('age_distribution_data [remote ranking]', dataAnalysis.age_distribution_data),
+            ):
+                results.append({'kind': 'function', 'name': name, **measure(fn, iterations)})
+        finally:
+            dataAnalysis.RANKING_API_URL = None
+            server.shutdown()
+
+    # 측정이 끝난 뒤 (이벤트가 합성 CSV에 행을 추가하므로 마지막에)
+    incremental_events = check_incremental(dataAnalysis, client)
+
+    # ru_maxrss: Linux는 KB, macOS는 바이트 단위
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    max_rss_mb = max_rss / 1024 / 1024 if sys.platform == 'darwin' else max_rss / 1024
+    return {'results': results, 'max_rss_mb': round(max_rss_mb, 1), 'incremental_events': incremental_events}
+
+
+def print_report(report):
+    """
+    배율별 결과 표 출력
+    """
+    header = f"{'case':<52}{'cold':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'req/s':>10}{'alloc MB':>10}"
+    for entry in report:
+        sizes = ', '.join(f"{key}={value:,}" for key, value in entry['sizes'].items())
+        print(f"\n== {entry['scale']:g}x ({sizes}), max RSS {entry['max_rss_mb']} MB")
+        print(header)
+        print('-' * len(header))
+        for row in entry['results']:
+            print(
+                f"{row['name']:<52}{row['cold_ms']:>10.2f}{row['p50_ms']:>10.2f}{row['p90_ms']:>10.2f}"
+                f"{row['p99_ms']:>10.2f}{row['throughput_per_s'] or 0:>10.1f}{row['peak_alloc_mb']:>10.2f}"
+            )
+        print(f"incremental == rebuild: OK ({entry['incremental_events']} events)")
+    print("\n(단위: ms, cold = 캐시가 비어 있는 첫 호출)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 100, 10000],
+                        help='현재 데이터 대비 배율 (기본: 1 100 10000)')
+    parser.add_argument('--iterations', type=int, default=20, help='케이스별 반복 횟수 (cold 호출 제외)')
+    parser.add_argument('--remote-ranking', action='store_true',
+                        help='로컬 HTTP 랭킹 서버를 쓰는 분리 배포 모드도 측정')
+    parser.add_argument('--json', help='결과를 저장할 JSON 파일 경로')
+    parser.add_argument('--keep-data', action='store_true', help='생성한 합성 데이터 폴더를 지우지 않음')
+    parser.add_argument('--run-scale', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scale:
+        # 자식 프로세스: 결과를 JSON으로 표준 출력의 마지막 줄에 씀
+        print(json.dumps(run_scale(args.iterations, args.remote_ranking), ensure_ascii=False))
+        return
+
+    report = []
+    for scale in args.scales:
+        work_dir = tempfile.mkdtemp(prefix=f'calmcafe-bench-{scale:g}x-')
+        try:
+            data_dir = os.path.join(work_dir, 'data')
+            print(f"[{scale:g}x] 합성 데이터 생성: {data_dir}", file=sys.stderr)
+            sizes = generate_dataset(data_dir, scale)
+
+            env = dict(
+                os.environ,
+                DATA_DIR=data_dir,
+                STATIC_DIR=os.path.join(work_dir, 'static'),
+                BASE_URL='http://127.0.0.1',
+            )
+            env.pop('RANKING_API_URL', None)
+            command = [sys.executable, os.path.abspath(__file__), '--run-scale', '--iterations', str(args.iterations)]
+            if args.remote_ranking:
+                command.append('--remote-ranking')
+
+            print(f"[{scale:g}x] 측정 중...", file=sys.stderr)
+            completed = subprocess.run(command, env=env, capture_output=True, text=True)
+            if completed.returncode != 0:
+                raise RuntimeError(f"{scale:g}x 벤치마크 실패:\n{completed.stderr}")
+            measured = json.loads(completed.stdout.strip().splitlines()[-1])
+            report.append({'scale': scale, 'sizes': sizes, **measured})
+        finally:
+            if args.keep_data:
+                print(f"[{scale:g}x] 데이터 유지: {work_dir}", file=sys.stderr)
+            else:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,44 @@
+import time
+
+# 콜드 스타트 측정 기준 (모듈 import 시작 시각)
+IMPORT_STARTED = time.perf_counter()
+
 import os
+import numpy as np
 import pandas as pd
-from flask import Flask, jsonify, request, send_from_directory, send_file
-import matplotlib
-import matplotlib.pyplot as plt
-from matplotlib import font_manager
-import requests
+from flask import Flask, jsonify, request, send_from_directory, g, has_request_context, stream_with_context
 import json
-from requests.models import Response
+import csv
+import base64
+import io
+from flask import Response
 from flask_cors import CORS
 from flask import make_response
 from flasgger import Swagger
-from PIL import Image, ImageDraw, ImageFont
 import platform
-
-app = Flask(__name__)
+import functools
+import importlib.util
+import threading
+import atexit
+import bisect
+import hashlib
+import collections
+import urllib.parse
+import glob
+import multiprocessing
+import queue
+import uuid
+import cProfile
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# matplotlib, PIL, requests, pyarrow는 처음 필요한 함수에서 불러옴 (워커 기동 시간 단축)
+# pyarrow는 설치 여부만 확인 (없으면 CSV만 사용)
+PYARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+# /static 요청은 serve_static에서 직접 처리 (ETag, Cache-Control 설정)
+app = Flask(__name__, static_folder=None)
 Swagger(app)
 
 
@@ -22,522 +47,3705 @@ CORS(app, resources={r"/api/*": {"origins": "*"}})
 # BASE_URL 설정: 환경 변수에서 가져오거나, 테스트 기본값("http://3.36.174.88:5001") 사용
 BASE_URL = os.getenv("BASE_URL", "http://3.36.174.88:5001").rstrip("/")
 
-matplotlib.use('Agg')
+# 랭킹 API URL: 설정된 경우에만 원격 서버에서 랭킹을 가져옴 (분리 배포용), 기본값은 프로세스 내 계산
+RANKING_API_URL = os.getenv("RANKING_API_URL", "").rstrip("/") or None
+
+# 차트 기본 크기 (기존 출력 이미지 크기 640x480 유지)
+DEFAULT_FIGSIZE = (6.4, 4.8)
+
+# 한글 카페 이름 표시용 폰트 후보 (macOS, Windows, Linux 순)
+KOREAN_FONT_CANDIDATES = ['AppleGothic', 'Malgun Gothic', 'NanumGothic']
+GENDER_LABELS = {'남': 'Male', '여': 'Female'}
+
+
+def configure_chart_font():
+    """
+    설치된 한글 폰트 중 첫 번째를 matplotlib 기본 폰트로 설정
+    """
+    import matplotlib
+    from matplotlib import font_manager
+
+    installed = {font.name for font in font_manager.fontManager.ttflist}
+    for family in KOREAN_FONT_CANDIDATES:
+        if family in installed:
+            matplotlib.rcParams['font.family'] = family
+            return family
+    return None
+
+
+# matplotlib은 첫 차트를 그릴 때 불러옴 (Agg 백엔드 + 한글 폰트 설정)
+_figure_class = None
+_figure_class_lock = threading.Lock()
+
+
+def chart_figure(**kwargs):
+    """
+    matplotlib Figure 생성 (처음 호출할 때 matplotlib을 불러오고 폰트 캐시를 준비)
+    """
+    global _figure_class
+    if _figure_class is None:
+        with _figure_class_lock:
+            if _figure_class is None:
+                import matplotlib
+                matplotlib.use('Agg')
+                from matplotlib.figure import Figure
+                configure_chart_font()
+                _figure_class = Figure
+    return _figure_class(**kwargs)
+
+
+def warm_plotting():
+    """
+    빈 차트를 메모리에 한 번 그려 matplotlib import, 폰트 캐시, Agg 렌더러를 준비
+    """
+    fig = chart_figure(figsize=DEFAULT_FIGSIZE)
+    ax = fig.subplots()
+    ax.bar(['warm-up'], [1])
+    ax.set_title('Warm-up')
+    fig.savefig(io.BytesIO(), format='png')
+
 
 # CSV 파일 경로 설정
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-file_path = os.path.join(BASE_DIR, '291.csv')
-store_favorite_path = os.path.join(BASE_DIR, 'store_favorite.csv')
-store_info_path = os.path.join(BASE_DIR, 'store(통합).csv')
-user_data_path = os.path.join(BASE_DIR, 'survey.csv')
-
-STATIC_FOLDER = os.path.join(BASE_DIR, 'static')
+# 데이터 폴더: 환경 변수 DATA_DIR로 바꿀 수 있음 (벤치마크 등)
+DATA_DIR = os.getenv("DATA_DIR", BASE_DIR)
+file_path = os.path.join(DATA_DIR, '291.csv')
+# 통합 혼잡도 테이블 (store_id, weekday, hour, predicted_people): 모든 카페의 예측 혼잡도를 한 파일에 저장
+congestion_path = os.path.join(DATA_DIR, 'congestion.csv')
+store_favorite_path = os.path.join(DATA_DIR, 'store_favorite.csv')
+store_info_path = os.path.join(DATA_DIR, 'store(통합).csv')
+user_data_path = os.path.join(DATA_DIR, 'survey.csv')
+
+# 컬럼 파일 폴더: CSV를 타입이 지정된 Arrow(Feather) 파일로 변환해 메모리 매핑으로 읽음
+COLUMNAR_FOLDER = os.path.join(DATA_DIR, 'columnar')
+COLUMNAR_STORAGE = PYARROW_AVAILABLE and os.getenv("COLUMNAR_STORAGE", "1") != "0"
+# 스키마를 바꾸면 이 값을 올려 기존 컬럼 파일을 다시 변환
+COLUMNAR_FORMAT_VERSION = 2
+
+# CSV별 컬럼 타입: datetime(시각), time(하루 중 시간 -> timedelta), category(사전 인코딩 문자열),
+# int32(id, 개수 등 정수 컬럼, 빈 값이 있으면 원래 타입 유지)
+DATASET_SCHEMAS = {
+    'store(통합).csv': {
+        'datetime': ['created_at', 'updated_at', 'user_congestion_input_time'],
+        'time': ['opening_time', 'closing_time', 'last_order_time'],
+        'int32': [
+            'id', 'current_customer_count', 'favorite_count', 'max_customer_count', 'store_congestion_level',
+            'store_congestion_value', 'user_congestion_level', 'user_congestion_value', 'user_id',
+        ],
+    },
+    'store_favorite.csv': {
+        'int32': ['store_id', 'user_id'],
+    },
+    'survey.csv': {
+        'int32': ['user_id', 'age'],
+        'category': [
+            'gender', 'cafe_visited_frequency', 'favorite_menu', 'convenience_facility_prefer', 'marriage',
+        ],
+    },
+}
+CONGESTION_SCHEMA = {'category': ['weekday'], 'int32': ['store_id', 'hour', 'predicted_people']}
+
+# 메모리에 올리는 컬럼: 파일마다 한 벌만 캐시하고 용도별로는 컬럼을 골라 씀 (복사 없음)
+STORE_COLUMNS = [
+    'id', 'name', 'address', 'latitude', 'longitude', 'store_congestion_level', 'store_congestion_value',
+]
+FAVORITE_COLUMNS = ['store_id', 'user_id']
+SURVEY_COLUMNS = ['user_id', 'gender', 'age', 'favorite_menu']
+
+# 대시보드 기본 카페 id (혼잡도 파일 이름에서 가져옴, 예: '291.csv' -> 291)
+TARGET_STORE_ID = int(os.path.basename(file_path).split('.')[0])
+
+STATIC_FOLDER = os.getenv("STATIC_DIR", os.path.join(BASE_DIR, 'static'))
 # Static 폴더가 없으면 생성
 if not os.path.exists(STATIC_FOLDER):
     os.makedirs(STATIC_FOLDER)
 
+# 내용 주소 기반 차트 캐시 폴더 (파일 이름에 입력 데이터 해시 포함)
+CHART_FOLDER = os.path.join(STATIC_FOLDER, 'charts')
+os.makedirs(CHART_FOLDER, exist_ok=True)
+
+# 차트 스타일을 바꾸면 이 값을 올려 기존 캐시를 무효화
+CHART_STYLE_VERSION = 2
+CHART_VERSIONS_TO_KEEP = 3
+# 최근 CHART_VERSIONS_TO_KEEP개가 아닌 버전도 마지막으로 URL을 내준 뒤 이 시간(초)이 지나야 삭제
+# (위치별 대시보드 차트처럼 같은 이름의 버전이 동시에 여러 개 쓰여도 이미 응답한 URL이 사라지지 않게)
+CHART_VERSION_RETENTION = int(os.getenv("CHART_VERSION_RETENTION", 60 * 60 * 24))
+CHART_MAX_AGE = 60 * 60 * 24 * 365  # 1년
+
+# 차트 렌더링 워커 프로세스 수 (0이면 요청 스레드에서 순서대로 렌더링)
+CHART_RENDER_WORKERS = int(os.getenv("CHART_RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+CHART_RENDER_TIMEOUT = 60  # 초
+
+# 비동기 렌더링 작업: 요청은 작업 ID만 받고 렌더링은 프로세스 내 작업 큐의 스레드가 처리
+RENDER_JOB_THREADS = int(os.getenv("RENDER_JOB_THREADS", 2))
+RENDER_JOB_TTL = 600  # 완료된 작업 상태를 보관하는 시간 (초)
+
 # pandas 경고 무시 설정
 pd.options.mode.chained_assignment = None
 
-def create_image_with_text(data, output_path):
+# Copy-on-Write 활성화: 캐시된 DataFrame을 얕은 복사로 넘겨도 원본이 바뀌지 않음 (pandas 3부터는 기본 동작)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+
+# 요청 계측: 단계별(span) 소요 시간을 요청마다 Server-Timing 헤더로, 프로세스 전체는 /api/_metrics로 제공
+METRIC_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# 요청별 cProfile 덤프: REQUEST_PROFILING=1일 때만 X-Profile 헤더가 있는 요청을 프로파일링
+REQUEST_PROFILING = os.getenv("REQUEST_PROFILING", "0") == "1"
+PROFILE_FOLDER = os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, 'profiles'))
+
+_metrics = {'stages': {}, 'counters': {}, 'started_at': time.time()}
+# 콜드 스타트: 모듈 import 시간과 preload 단계별 시간 (초)
+_startup = {'import_s': None, 'preload': None}
+_metrics_lock = threading.Lock()
+_span_local = threading.local()
+
+
+def observe_metric(name, elapsed_ms):
     """
-    데이터 리스트를 이미지에 텍스트로 렌더링
+    단계별 지연 시간 히스토그램에 값 추가
     """
-    width, height = 800, 600
-    background_color = (255, 255, 255)
-    text_color = (0, 0, 0)
-
-    # 이미지와 드로잉 객체 생성
-    img = Image.new("RGB", (width, height), color=background_color)
-    draw = ImageDraw.Draw(img)
+    with _metrics_lock:
+        stage = _metrics['stages'].get(name)
+        if stage is None:
+            stage = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'buckets': [0] * (len(METRIC_BUCKETS_MS) + 1)}
+            _metrics['stages'][name] = stage
+        stage['count'] += 1
+        stage['total_ms'] += elapsed_ms
+        stage['max_ms'] = max(stage['max_ms'], elapsed_ms)
+        bucket = next(
+            (i for i, bound in enumerate(METRIC_BUCKETS_MS) if elapsed_ms <= bound), len(METRIC_BUCKETS_MS)
+        )
+        stage['buckets'][bucket] += 1
 
-   # 폰트 경로 설정
-    try:
-        if platform.system() == 'Darwin':  # macOS
-            font_path = "/Library/Fonts/AppleSDGothicNeo.ttc"
-        elif platform.system() == 'Windows':  # Windows
-            font_path = "C:\\Windows\\Fonts\\malgun.ttf"
-        else:  # Linux
-            font_path = "/usr/share/fonts/truetype/nanum/NanumGothic.ttf"  # Linux에서 사용하는 한글 폰트
 
-        # 폰트 로드
-        font = ImageFont.truetype(font_path, 20)
-    except IOError:
-        # 폰트 로드 실패 시 기본 폰트 사용
-        font = ImageFont.load_default()
+def increment_counter(name, amount=1):
+    """
+    카운터 증가 (캐시 적중/미스, 응답 상태 코드 등)
+    """
+    with _metrics_lock:
+        _metrics['counters'][name] = _metrics['counters'].get(name, 0) + amount
 
-    # 텍스트 내용 작성
-    x, y = 50, 50
-    for rank, item in enumerate(data, start=1):
-        text = f"{rank}. {item['name']} - {item['favorite_count']}"
-        draw.text((x, y), text, fill=text_color, font=font)
-        y += 30
 
-    # 이미지 저장
-    img.save(output_path)
+def record_span(name, elapsed_ms):
+    """
+    단계 소요 시간 기록: 프로세스 히스토그램 + 현재 요청(또는 워커 수집기)의 단계 목록
+    """
+    observe_metric(name, elapsed_ms)
+    collector = getattr(_span_local, 'collector', None)
+    if collector is not None:
+        collector.append((name, elapsed_ms))
+    elif has_request_context():
+        g.setdefault('spans', []).append((name, elapsed_ms))
 
 
-@app.route('/api/gyeonggi-favorites-image', methods=['GET'])
-def get_gyeonggi_favorites_image():
+@contextmanager
+def span(name):
     """
-    API to generate an image of cafe rankings in Gyeonggi-do.
+    with span('load'): ... 형태로 단계 소요 시간 측정
     """
+    start = time.perf_counter()
     try:
-        # CSV 데이터 읽기
-        store_favorite = pd.read_csv(store_favorite_path)
-        store_info = pd.read_csv(store_info_path)
+        yield
+    finally:
+        record_span(name, (time.perf_counter() - start) * 1000)
 
-        # 데이터 병합
-        merged_data = pd.merge(
-            store_favorite, store_info, left_on='store_id', right_on='id', how='inner'
-        )
 
-        # 경기도 지역 필터링
-        gyeonggi_data = merged_data[merged_data['address'].str.contains('경기도', case=False, na=False)]
+@contextmanager
+def collect_spans():
+    """
+    요청 컨텍스트가 없는 곳(렌더링 워커 프로세스)에서 단계 기록을 모아 반환
+    """
+    spans = []
+    previous = getattr(_span_local, 'collector', None)
+    _span_local.collector = spans
+    try:
+        yield spans
+    finally:
+        _span_local.collector = previous
+
 
-        # 즐겨찾기 수 집계
-        gyeonggi_favorites_with_name = (
-            gyeonggi_data.groupby(['store_id', 'name'])
-            .size()
-            .reset_index(name='favorite_count')
-            .sort_values(by='favorite_count', ascending=False)
-        )
+def server_timing_header(spans, total_ms):
+    """
+    단계 목록을 Server-Timing 헤더 값으로 변환 (같은 이름은 합산)
+    """
+    totals = {}
+    for name, elapsed_ms in spans:
+        totals[name] = totals.get(name, 0.0) + elapsed_ms
+    entries = [f"{name};dur={elapsed_ms:.1f}" for name, elapsed_ms in totals.items()]
+    entries.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(entries)
+
+
+@app.before_request
+def start_request_timing():
+    g.request_started = time.perf_counter()
+    if REQUEST_PROFILING and request.headers.get('X-Profile'):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.after_request
+def finish_request_timing(response):
+    total_ms = (time.perf_counter() - g.get('request_started', time.perf_counter())) * 1000
+    endpoint = request.endpoint or 'unknown'
+    observe_metric(f"request:{endpoint}", total_ms)
+    increment_counter(f"status:{response.status_code}")
+
+    response.headers['Server-Timing'] = server_timing_header(g.get('spans', []), total_ms)
+    response.headers['Timing-Allow-Origin'] = '*'
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(PROFILE_FOLDER, exist_ok=True)
+        profile_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{os.getpid()}-{threading.get_ident()}.prof"
+        profiler.dump_stats(os.path.join(PROFILE_FOLDER, profile_name))
+        response.headers['X-Profile-File'] = profile_name
+    return response
+
+
+@app.teardown_request
+def stop_request_profiler(exc):
+    # 응답 생성 전에 예외가 난 경우에도 프로파일러를 끔
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+
+
+def metrics_snapshot():
+    """
+    단계별 히스토그램과 카운터 사본 (/api/_metrics 응답)
+    """
+    with _metrics_lock:
+        stages = {}
+        for name, stage in sorted(_metrics['stages'].items()):
+            bounds = METRIC_BUCKETS_MS + ['inf']
+            stages[name] = {
+                'count': stage['count'],
+                'total_ms': round(stage['total_ms'], 3),
+                'mean_ms': round(stage['total_ms'] / stage['count'], 3) if stage['count'] else 0.0,
+                'max_ms': round(stage['max_ms'], 3),
+                'buckets': [{'le': bound, 'count': count} for bound, count in zip(bounds, stage['buckets'])],
+            }
+        return {
+            'pid': os.getpid(),
+            'uptime_s': round(time.time() - _metrics['started_at'], 1),
+            'stages': stages,
+            'counters': dict(sorted(_metrics['counters'].items())),
+            'startup': dict(_startup),
+        }
+
+
+# 데이터셋 캐시: (파일 경로, 컬럼) -> ((mtime, size), DataFrame)
+_dataset_cache = {}
+_dataset_lock = threading.Lock()
+
+
+def dataset_signature(path):
+    """
+    파일 변경 여부 판단용 시그니처 (mtime, size)
+    """
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
 
-        results = gyeonggi_favorites_with_name[['name', 'favorite_count']].to_dict(
-            orient='records'
-        )
 
-        # 이미지 생성
-        output_path = os.path.join(STATIC_FOLDER, 'gyeonggi_favorites.png')
-        create_image_with_text(results, output_path)
+def dataset_schema(path):
+    """
+    CSV 파일의 컬럼 타입 설정 반환 (혼잡도 파일은 공통 스키마 사용)
+    """
+    name = os.path.basename(path)
+    if path == congestion_path or os.path.splitext(name)[0].isdigit():
+        return CONGESTION_SCHEMA
+    return DATASET_SCHEMAS.get(name, {})
 
-        # 이미지 URL 반환
-        image_url = f"{BASE_URL}/static/gyeonggi_favorites.png"
-        return jsonify({"imageUrl": image_url})
 
-    except Exception as e:
-        return Response(
-            json.dumps({"error": str(e)}, ensure_ascii=False),
-            content_type="application/json; charset=utf-8",
-            status=500,
-        )
+def apply_dataset_schema(data, schema):
+    """
+    문자열 컬럼을 datetime, timedelta(하루 중 시간), category 타입으로 변환
+    """
+    for column in schema.get('datetime', []):
+        if column in data.columns:
+            data[column] = pd.to_datetime(data[column], format='ISO8601', errors='coerce')
+    for column in schema.get('time', []):
+        if column in data.columns:
+            data[column] = pd.to_timedelta(data[column], errors='coerce')
+    for column in schema.get('category', []):
+        if column in data.columns:
+            data[column] = data[column].astype('category')
+    for column in schema.get('int32', []):
+        if column in data.columns and pd.api.types.is_numeric_dtype(data[column]) and not data[column].isna().any():
+            data[column] = data[column].astype(np.int32)
+    return data
+
+
+def read_csv_typed(path, columns=None):
+    """
+    CSV를 읽어 스키마에 맞게 타입 변환 (columns가 있으면 해당 컬럼만 파싱)
+    """
+    data = pd.read_csv(path, usecols=columns)
+    if columns:
+        data = data[list(columns)]
+    return apply_dataset_schema(data, dataset_schema(path))
 
 
-@app.route('/api/gyeonggi-favorites', methods=['GET'])
-def get_gyeonggi_favorites():
+def columnar_path(path):
     """
-    API to return cafe rankings in Gyeonggi-do as JSON data.
+    CSV에 대응하는 컬럼 파일 경로 (예: 'survey.csv' -> 'columnar/survey.arrow')
     """
-    try:
-        # CSV 데이터 읽기
-        store_favorite = pd.read_csv(store_favorite_path)
-        store_info = pd.read_csv(store_info_path)
+    return os.path.join(COLUMNAR_FOLDER, os.path.splitext(os.path.basename(path))[0] + '.arrow')
 
-        # 데이터 병합
-        merged_data = pd.merge(
-            store_favorite, store_info, left_on='store_id', right_on='id', how='inner'
-        )
 
-        # 경기도 지역 필터링
-        gyeonggi_data = merged_data[merged_data['address'].str.contains('경기도', case=False, na=False)]
+def columnar_signature(path):
+    """
+    컬럼 파일에 기록된 원본 CSV 시그니처 (파일이 없으면 None)
+    """
+    import pyarrow as pa
 
-        # 즐겨찾기 수 집계
-        gyeonggi_favorites_with_name = (
-            gyeonggi_data.groupby(['store_id', 'name'])
-            .size()
-            .reset_index(name='favorite_count')
-            .sort_values(by='favorite_count', ascending=False)
-        )
+    try:
+        with pa.memory_map(path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    signature = metadata.get(b'source_signature')
+    if not signature or metadata.get(b'format_version') != str(COLUMNAR_FORMAT_VERSION).encode('utf-8'):
+        return None
+    return tuple(json.loads(signature))
 
-        results = gyeonggi_favorites_with_name[['name', 'favorite_count']].to_dict(
-            orient='records'
-        )
 
-        response = make_response(jsonify(results))
-        response.headers['Cache-Control'] = 'no-store'  # 캐시 비활성화
-        return response
+def ingest_dataset(path):
+    """
+    CSV를 타입이 지정된 Arrow(Feather) 컬럼 파일로 변환
+    문자열 범주는 사전 인코딩, 시각은 timestamp, 하루 중 시간은 duration으로 저장하며
+    메모리 매핑이 가능하도록 압축하지 않음
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    os.makedirs(COLUMNAR_FOLDER, exist_ok=True)
+    signature = dataset_signature(path)
+    table = pa.Table.from_pandas(read_csv_typed(path), preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        b'source_signature': json.dumps(list(signature)).encode('utf-8'),
+        b'format_version': str(COLUMNAR_FORMAT_VERSION).encode('utf-8'),
+    })
+
+    # 임시 파일에 쓴 뒤 교체해 다른 워커가 쓰다 만 파일을 읽지 않게 함
+    target = columnar_path(path)
+    temp_path = f'{target}.{os.getpid()}-{threading.get_ident()}.tmp'
+    try:
+        feather.write_feather(table, temp_path, compression='uncompressed')
+        os.replace(temp_path, target)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return target
+
+
+def ingest_datasets():
+    """
+    모든 CSV 데이터 소스를 컬럼 파일로 변환 (배포 전 미리 실행하면 첫 요청의 CSV 파싱을 생략)
+    """
+    paths = [store_info_path, store_favorite_path, user_data_path] + congestion_source_paths()
+    return [ingest_dataset(path) for path in paths]
 
-    except Exception as e:
-        return Response(
-            json.dumps({"error": str(e)}, ensure_ascii=False),
-            content_type="application/json; charset=utf-8",
-            status=500,
-        )
 
-def preprocess_data(api_url, user_data_path, store_favorite_path, store_info_path):
+def read_dataset(path, signature, columns=None):
     """
-    데이터를 API 및 파일에서 병합하고 정리
+    데이터셋 읽기: 컬럼 파일이 최신이면 메모리 매핑으로 필요한 컬럼만 읽고, 아니면 먼저 변환
+    변환하거나 읽지 못하면 (읽기 전용 데이터 폴더, 손상된 파일 등) CSV를 직접 읽음
     """
+    if not COLUMNAR_STORAGE:
+        return read_csv_typed(path, columns)
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    target = columnar_path(path)
     try:
-        # API 데이터 가져오기
-        response = requests.get(api_url)
-        if response.status_code == 200:
-            api_data = pd.DataFrame(response.json())
+        if columnar_signature(target) != signature:
+            with span('ingest'):
+                ingest_dataset(path)
+        # split_blocks: 빈 값 없는 숫자 컬럼은 메모리 매핑된 버퍼를 그대로 사용 (워커 간 페이지 공유)
+        return feather.read_table(target, columns=columns, memory_map=True).to_pandas(split_blocks=True)
+    except (OSError, pa.ArrowInvalid) as e:
+        print(f"컬럼 파일 사용 불가, CSV로 읽음 ({os.path.basename(path)}): {e}")
+        increment_counter('columnar_fallback')
+        return read_csv_typed(path, columns)
+
+
+def load_dataset(path, columns=None):
+    """
+    데이터 테이블을 프로세스 전체에서 한 번만 읽어 공유
+    파일의 mtime/size가 바뀐 경우에만 다시 읽고, 호출자에게는 읽기 전용(Copy-on-Write) 사본을 반환
+    columns를 지정하면 해당 컬럼만 읽음
+    """
+    signature = dataset_signature(path)
+    key = (path, tuple(columns) if columns else None)
+
+    with _dataset_lock:
+        cached = _dataset_cache.get(key)
+        if cached is None or cached[0] != signature:
+            increment_counter('dataset_cache_miss')
+            with span('load'):
+                cached = (signature, read_dataset(path, signature, columns))
+            _dataset_cache[key] = cached
         else:
-            raise ValueError("API에서 데이터를 가져오지 못했습니다.")
+            increment_counter('dataset_cache_hit')
 
-        # 데이터 파일 읽기
-        user_data = pd.read_csv(user_data_path)
-        store_favorite = pd.read_csv(store_favorite_path)
-        store_info = pd.read_csv(store_info_path)
+    # 얕은 복사: 호출자가 컬럼을 바꿔도 캐시 원본에는 영향 없음
+    return cached[1].copy(deep=False)
 
-        # 카페 이름 데이터 정리
-        store_info['name'] = store_info['name'].str.strip().str.lower()
-        api_data['name'] = api_data['name'].str.strip().str.lower()
 
-        # 병합
-        merged_api_data = pd.merge(api_data, store_info[['id', 'name']], on='name', how='left')
+def clear_dataset_cache():
+    """
+    캐시된 데이터셋을 모두 비움 (다음 호출에서 다시 읽음)
+    """
+    with _dataset_lock:
+        _dataset_cache.clear()
 
-        print(merged_api_data[['name', 'id']])  # 이름과 id를 확인해 봄
-        return user_data, store_favorite, merged_api_data
-    except Exception as e:
-        print(f"데이터 처리 오류: {e}")
-        return None, None, None
 
+# 연령대 구간 설정: AGE_BINS[i] 이상 AGE_BINS[i + 1] 미만이 AGE_LABELS[i] (19세는 Under 20s, 29세는 20s)
+AGE_BINS = [0, 20, 30, 40, 50, 60, 120]
+AGE_LABELS = ['Under 20s', '20s', '30s', '40s', '50s', '60s and Above']
 
-def generate_gender_distribution_image(output_path):
+# 인구통계 항목 (설문 컬럼): 설문 행별 정수 코드로 한 번만 변환해 두고 bincount로 집계
+DEMOGRAPHIC_COLUMNS = ('gender', 'age_group', 'favorite_menu')
+
+
+def age_codes(ages):
     """
-    성별 분포 그래프를 생성하고 이미지를 저장
+    나이 배열을 연령대 코드(AGE_LABELS 위치)로 변환 (범위 밖이거나 없으면 -1)
     """
-    try:
-        api_url = f"{BASE_URL}/api/gyeonggi-favorites"
-        user_data, store_favorite, api_data = preprocess_data(
-            api_url, user_data_path, store_favorite_path, store_info_path
-        )
+    ages = np.asarray(ages, dtype=float)
+    codes = np.searchsorted(AGE_BINS, ages, side='right') - 1
+    return np.where(np.isnan(ages) | (codes < 0) | (codes >= len(AGE_LABELS)), -1, codes).astype(np.int8)
 
-        if user_data is None or store_favorite is None or api_data is None:
-            raise ValueError("데이터 병합 중 오류 발생.")
 
-        # 성별 데이터 병합 및 정리
-        user_gender_data = pd.merge(
-            store_favorite, user_data[['user_id', 'gender']], on='user_id', how='inner'
-        )
-        gender_distribution = user_gender_data.groupby(['store_id', 'gender']).size().unstack(fill_value=0)
+def demographic_codes(user_data):
+    """
+    설문 행별 인구통계 코드 {항목: (코드 배열 (없으면 -1), 항목 값 Index)}
+    성별, 선호 메뉴는 값 정렬 순서, 연령대는 AGE_LABELS 순서
+    """
+    codes = {'age_group': (age_codes(user_data['age']), pd.Index(AGE_LABELS, name='age_group'))}
+    for column in ('gender', 'favorite_menu'):
+        values, categories = pd.factorize(user_data[column], sort=True)
+        dtype = np.int8 if len(categories) < 2 ** 7 else np.int32
+        codes[column] = (values.astype(dtype), pd.Index(categories, name=column))
+    return codes
+
+
+def category_order(column, categories):
+    """
+    항목 값의 표시 순서 (연령대는 AGE_LABELS 순서, 나머지는 값 정렬 순서)
+    설문 추가로 항목 값 Index 끝에 붙은 값도 CSV 전체로 다시 만든 인덱스와 같은 순서가 됨
+    """
+    return np.arange(len(categories)) if column == 'age_group' else categories.argsort()
 
-        # 병합 결과 정리
-        gender_distribution = pd.merge(
-            gender_distribution, api_data[['name', 'favorite_count', 'id']], left_index=True, right_on='id', how='inner'
+
+def demographic_crosstabs(codes, groups, user_pos, n_groups):
+    """
+    (그룹 번호, 설문 행 위치) 쌍 배열로 그룹 x 항목 인원표를 np.bincount로 계산
+    반환값: {항목: (n_groups, 항목 값 수) 인원 배열} (해당 항목이 빈 응답은 제외)
+    """
+    tables = {}
+    for column in DEMOGRAPHIC_COLUMNS:
+        values, categories = codes[column]
+        values = values[user_pos]
+        answered = values >= 0
+        counts = np.bincount(
+            groups[answered].astype(np.int64) * len(categories) + values[answered],
+            minlength=n_groups * len(categories),
         )
-        gender_distribution.set_index('name', inplace=True)
+        tables[column] = counts.reshape(n_groups, len(categories))
+    return tables
 
-        # 그래프 생성
-        if not gender_distribution.empty:
-            plt.figure(figsize=(12, 8))
-            gender_distribution[['남', '여']].plot(kind='bar', stacked=True, color=['skyblue', 'pink'])
-            plt.title('Gender Distribution in Nearby Favorite Cafes', fontsize=14)
-            plt.xlabel('Cafe Name', fontsize=12)
-            plt.ylabel('Number of Favorites (People)', fontsize=12)
-            plt.xticks(rotation=55, fontsize=12)
-            plt.legend(title='Gender', labels=['Male', 'Female'], fontsize=12)
-            plt.tight_layout()
-            plt.savefig(output_path)
-            plt.close()
-            return True
-        else:
-            print("성별 데이터가 부족합니다.")
-            return False
-    except Exception as e:
-        print(f"성별 분포 그래프 생성 오류: {e}")
-        return False
+# id 인덱스: 정수 id -> 행 위치 (카페, 설문 사용자), 데이터 버전별로 한 번만 생성
+_id_index = {'version': None, 'data': None}
+_id_index_lock = threading.Lock()
 
 
-def generate_age_distribution_image(output_path):
+def favorites_data_version():
     """
-    연령대 분포 그래프를 생성하고 이미지를 저장
+    즐겨찾기 관련 CSV(즐겨찾기, 카페, 설문)의 현재 버전
     """
-    try:
-        # API 데이터 가져오기
-        API_URL = f"{BASE_URL}/api/gyeonggi-favorites"
-        response = requests.get(API_URL)
-        if response.status_code == 200:
-            data = response.json()
-        else:
-            print("데이터를 가져오는 데 실패했습니다.")
-            data = []
+    return tuple(
+        dataset_signature(path) for path in (store_favorite_path, store_info_path, user_data_path)
+    )
+
+
+def build_id_index():
+    """
+    정수 id 기반 조인 인덱스 생성
+    - store_ids / user_ids: 카페 id, 설문 user_id -> 행 위치 해시 인덱스 (get_indexer로 조회)
+    - user_rows: user_ids 위치별 설문 행 번호
+    - favorite_store_pos / favorite_user_pos: 즐겨찾기 행별 카페, 설문 행 위치 (없으면 -1)
+    - favorites_by_store: 카페 행 위치 순으로 정렬된 즐겨찾기 행 번호와 카페별 시작 오프셋
+    - favorite_user_ids / favorites_by_user: 즐겨찾기 user_id -> 위치, 사용자 순으로 정렬된 즐겨찾기 행 번호와 오프셋
+    - name_to_id: 정규화한 카페 이름 -> id (이름이 겹치는 카페는 제외, 원격 랭킹 호환용)
+    - demographics: 설문 행별 성별, 연령대, 선호 메뉴 코드 (demographic_codes)
+    - appended_user_rows / appended_by_store / appended_by_user: 인덱스 생성 후 추가된 설문 행,
+      카페별 / 사용자별 즐겨찾기 행 (apply_*_event)
+    - buffers: 추가 이벤트로 늘어나는 배열의 여유 버퍼 (append_value)
+    """
+    store_info = load_dataset(store_info_path, STORE_COLUMNS)
+    store_favorite = load_dataset(store_favorite_path, FAVORITE_COLUMNS)
+    user_data = load_dataset(user_data_path, SURVEY_COLUMNS)
+
+    store_ids = pd.Index(store_info['id'])
+    # 같은 user_id의 설문이 여러 개면 마지막 응답을 사용
+    user_rows = user_data['user_id'].drop_duplicates(keep='last')
+    user_ids = pd.Index(user_rows.to_numpy())
+    user_positions = user_rows.index.to_numpy()
+
+    # 위치 배열은 int32로 보관 (행 수가 2^31 미만)
+    user_positions = user_positions.astype(np.int32)
+    favorite_store_pos = store_ids.get_indexer(store_favorite['store_id']).astype(np.int32)
+    favorite_user_pos = user_ids.get_indexer(store_favorite['user_id'])
+    favorite_user_pos = np.where(favorite_user_pos >= 0, user_positions[favorite_user_pos], -1).astype(np.int32)
+
+    # 카페별 즐겨찾기 목록 (CSR 형태): order[offsets[i]:offsets[i + 1]]가 i번째 카페의 즐겨찾기 행
+    order = np.argsort(favorite_store_pos, kind='stable').astype(np.int32)
+    offsets = np.searchsorted(favorite_store_pos[order], np.arange(len(store_ids) + 1)).astype(np.int32)
+
+    # 사용자별 즐겨찾기 목록 (설문이 나중에 추가되면 기존 즐겨찾기의 설문 행을 옮기는 데 사용)
+    user_codes, favorite_user_ids = pd.factorize(store_favorite['user_id'])
+    user_order = np.argsort(user_codes, kind='stable').astype(np.int32)
+    user_offsets = np.searchsorted(user_codes[user_order], np.arange(len(favorite_user_ids) + 1)).astype(np.int32)
+
+    normalized_names = store_info['name'].str.strip().str.lower()
+    unique_names = ~normalized_names.duplicated(keep=False)
+
+    return {
+        'store_ids': store_ids,
+        'user_ids': user_ids,
+        'user_rows': user_positions,
+        'favorite_store_pos': favorite_store_pos,
+        'favorite_user_pos': favorite_user_pos,
+        'favorites_by_store': (order, offsets),
+        'favorite_user_ids': pd.Index(favorite_user_ids),
+        'favorites_by_user': (user_order, user_offsets),
+        'name_to_id': dict(zip(normalized_names[unique_names], store_info['id'][unique_names])),
+        'demographics': demographic_codes(user_data),
+        'appended_user_rows': {},
+        'appended_by_store': {},
+        'appended_by_user': {},
+        'buffers': {},
+    }
+
+
+def get_id_index():
+    """
+    현재 데이터 버전의 id 인덱스 반환 (CSV가 바뀐 경우에만 다시 생성)
+    """
+    version = favorites_data_version()
+    with _id_index_lock:
+        if _id_index['version'] != version:
+            with span('merge'):
+                _id_index['data'] = build_id_index()
+            _id_index['version'] = version
+        return _id_index['data']
 
-        df_api = pd.DataFrame(data)
 
-        # 데이터 파일 읽기
-        user_data = pd.read_csv(user_data_path)
-        store_favorite = pd.read_csv(store_favorite_path)
-        store_info = pd.read_csv(store_info_path)
+def append_value(buffers, name, array, value):
+    """
+    배열 끝에 값 하나를 붙인 배열 반환
+    buffers[name]에 용량을 두 배씩 늘리는 여유 버퍼를 두어 평균 O(1) (반환값은 버퍼 앞부분의 뷰)
+    """
+    size = len(array)
+    buffer = buffers.get(name)
+    if buffer is None or array.base is not buffer or len(buffer) == size:
+        buffer = np.empty(max(2 * size, 16), dtype=array.dtype)
+        buffer[:size] = array
+        buffers[name] = buffer
+    buffer[size] = value
+    return buffer[:size + 1]
 
-        # 카페 이름 확인
-        print(store_info[['name']].head())
-        print(df_api[['name']].head())
 
-        # 데이터 병합 및 정제
-        user_age_data = pd.merge(
-            store_favorite, user_data[['user_id', 'age']], on='user_id', how='inner'
-        )
+def survey_row_of(index, user_id):
+    """
+    사용자의 마지막 설문 행 위치 (설문이 없으면 -1)
+    """
+    row = index['appended_user_rows'].get(user_id)
+    if row is None:
+        position = index['user_ids'].get_indexer([user_id])[0]
+        row = index['user_rows'][position] if position >= 0 else -1
+    return row
 
-        bins = [0, 19, 29, 39, 49, 59, 120]
-        labels = ['Under 20s', '20s', '30s', '40s', '50s', '60s and Above']
-        user_age_data['age_group'] = pd.cut(user_age_data['age'], bins=bins, labels=labels, right=False)
 
-        # 연령대별 카페별 방문자 수 집계
-        user_age_data['age_group'] = user_age_data['age_group'].astype(str)  # 문자열로 변환
-        print(user_age_data.head())
-        age_distribution = user_age_data.groupby(['store_id', 'age_group']).size().unstack(fill_value=0)
+def store_favorite_rows(index, store_pos):
+    """
+    카페(행 위치)의 즐겨찾기 행 번호 (인덱스 생성 후 추가된 행 포함)
+    """
+    order, offsets = index['favorites_by_store']
+    rows = order[offsets[store_pos]:offsets[store_pos + 1]]
+    appended = index['appended_by_store'].get(store_pos)
+    return np.concatenate([rows, np.array(appended, dtype=rows.dtype)]) if appended else rows
 
-        # API 데이터와 Store 정보 병합
-        store_info['name'] = store_info['name'].str.strip().str.lower()
-        df_api['name'] = df_api['name'].str.strip().str.lower()
-        df_api = pd.merge(df_api, store_info[['id', 'name']], left_on='name', right_on='name', how='left')
 
-        # 병합 결과 정리
-        age_distribution = pd.merge(
-            age_distribution, df_api[['name', 'favorite_count', 'id']], left_index=True, right_on='id', how='inner'
-        )
+def user_favorite_rows(index, user_id):
+    """
+    사용자의 즐겨찾기 행 번호 (인덱스 생성 후 추가된 행 포함)
+    """
+    order, offsets = index['favorites_by_user']
+    position = index['favorite_user_ids'].get_indexer([user_id])[0]
+    rows = order[offsets[position]:offsets[position + 1]] if position >= 0 else order[:0]
+    appended = index['appended_by_user'].get(user_id)
+    return np.concatenate([rows, np.array(appended, dtype=rows.dtype)]) if appended else rows
+
+
+def user_favorite_stores(index, user_id):
+    """
+    사용자가 즐겨찾기한 카페 id 목록 (카페 정보가 있는 카페만, 인덱스 생성 후 추가된 즐겨찾기 포함)
+    """
+    store_pos = index['favorite_store_pos'][user_favorite_rows(index, user_id)]
+    return index['store_ids'].to_numpy()[store_pos[store_pos >= 0]].tolist()
 
-        # 데이터 정리
-        age_distribution['favorite_count'] = pd.to_numeric(age_distribution['favorite_count'], errors='coerce')
-        age_distribution = age_distribution.dropna()
-        age_distribution.set_index('name', inplace=True)
 
-        
+# 즐겨찾기 집계 인덱스: 데이터 버전(파일 시그니처)별로 한 번만 생성
+_favorites_index = {'version': None, 'data': None}
+_favorites_index_lock = threading.Lock()
 
-        if not age_distribution.empty:
 
-            age_colors = ['#f09e90', '#edd75f', '#67c967', '#5c95cc', '#faa7d4', '#c4a6e0']
+def parse_region(address):
+    """
+    주소 Series를 (province, city) DataFrame으로 분리 (예: '경기도 고양시 ...' -> '경기도', '고양시')
+    """
+    parts = address.fillna('').str.split(n=2, expand=True).reindex(columns=[0, 1])
+    return pd.DataFrame(
+        {'province': parts[0].astype('category'), 'city': parts[1].astype('category')}, index=address.index
+    )
+
+
+def build_rankings(stores, favorite_counts):
+    """
+    카페별 즐겨찾기 수로 랭킹 순서 생성 (DataFrame은 조회할 때 ranking_frame으로 만듦)
+    - ranking_orders: None(전체) / (province, None) / (province, city) -> 랭킹 순서의 카페 행 위치
+      (즐겨찾기 수 내림차순, 같으면 store_id 오름차순, 즐겨찾기가 없는 카페는 제외)
+    - rankings: ranking_orders로 만든 랭킹 DataFrame 캐시 (이벤트로 순서가 바뀐 랭킹만 버림)
+    - ranking_totals: ranking_orders와 같은 키별 즐겨찾기 합계 (X-Total-Favorites 헤더)
+    - ranking_store_ids / store_regions: 카페 행 위치별 store_id, (province, city) 배열
+    """
+    store_ids = stores['store_id'].to_numpy()
+    ranked = np.flatnonzero(favorite_counts > 0)
+    order = ranked[np.lexsort((store_ids[ranked], -favorite_counts[ranked]))].astype(np.int32)
+
+    # 지역별 랭킹 (전체 랭킹 순서 유지)
+    regions = stores[['province', 'city']].iloc[order]
+    ranking_orders = {None: order}
+    for province, rows in regions.groupby('province', sort=False, observed=True).indices.items():
+        ranking_orders[(province, None)] = order[rows]
+    for region, rows in regions.groupby(['province', 'city'], sort=False, observed=True).indices.items():
+        ranking_orders[region] = order[rows]
+    ranking_totals = collections.Counter({
+        key: int(favorite_counts[positions].sum()) for key, positions in ranking_orders.items()
+    })
+
+    return {
+        'ranking_orders': ranking_orders,
+        'rankings': {},
+        'ranking_totals': ranking_totals,
+        'ranking_store_ids': store_ids,
+        'store_regions': (stores['province'].to_numpy(), stores['city'].to_numpy()),
+    }
+
+
+def ranking_frame(index, key):
+    """
+    랭킹 순서를 DataFrame(store_id, name, province, city, favorite_count)으로 반환 (없는 지역은 빈 랭킹)
+    캐시가 없을 때만 만듦 (_favorites_index_lock을 잡고 호출)
+    """
+    frame = index['rankings'].get(key)
+    if frame is None:
+        order = index['ranking_orders'].get(key)
+        if order is None:
+            return ranking_frame(index, None).iloc[0:0]
+        frame = index['stores'].iloc[order].reset_index(drop=True)
+        frame['favorite_count'] = index['favorite_counts'][order]
+        index['rankings'][key] = frame
+    return frame
+
+
+def move_ranking_entry(index, key, store_pos, previous_count):
+    """
+    즐겨찾기 수가 previous_count에서 늘어난 카페 한 곳의 자리만 랭킹 순서에서 옮김
+    정렬 키(-즐겨찾기 수, store_id)로 이진 탐색해 사이 구간만 한 칸 밀고, 처음 들어가는 카페는 삽입
+    """
+    counts, store_ids = index['favorite_counts'], index['ranking_store_ids']
+
+    def sort_key(pos):
+        return -counts[pos], store_ids[pos]
+
+    orders = index['ranking_orders']
+    order = orders.get(key)
+    if order is None or previous_count == 0:
+        order = np.empty(0, dtype=np.int32) if order is None else order
+        orders[key] = np.insert(order, bisect.bisect_left(order, sort_key(store_pos), key=sort_key), store_pos)
+        return
+
+    # 이 카페의 키는 이미 작아졌으므로 이전 키로 찾은 위치의 바로 앞이 현재 자리
+    current = bisect.bisect_left(order, (-previous_count, store_ids[store_pos]), key=sort_key) - 1
+    target = bisect.bisect_left(order, sort_key(store_pos), hi=current, key=sort_key)
+    order[target + 1:current + 1] = order[target:current].copy()
+    order[target] = store_pos
 
-            # 그래프 생성
-            
-            plt.figure(figsize=(12, 8))
 
-            age_distribution[labels].plot(
-                kind='bar', stacked=True, color=age_colors
+def increment_favorite_count(index, store_pos):
+    """
+    카페 한 곳의 즐겨찾기 수를 1 늘리고 전체, 시/도, 시/군/구 랭킹에서 그 카페의 자리만 옮김
+    """
+    counts = index['favorite_counts']
+    previous_count = counts[store_pos]
+    counts[store_pos] += 1
+
+    provinces, cities = index['store_regions']
+    province, city = provinces[store_pos], cities[store_pos]
+    keys = [None]
+    if not pd.isna(province):
+        keys.append((province, None))
+        if not pd.isna(city):
+            keys.append((province, city))
+    for key in keys:
+        index['ranking_totals'][key] += 1
+        move_ranking_entry(index, key, store_pos, previous_count)
+        index['rankings'].pop(key, None)
+
+
+def favorites_demographic_tables(demographic_counts, store_ids):
+    """
+    카페 행 위치별 인원표를 gender_by_store / age_by_store / menu_by_store DataFrame으로 변환
+    항목마다 해당 항목에 응답한 즐겨찾기가 있는 카페만 행으로,
+    성별과 선호 메뉴는 인원이 있는 값만 컬럼으로 남김 (연령대는 AGE_LABELS 전체)
+    """
+    tables = {}
+    for column, key in zip(DEMOGRAPHIC_COLUMNS, ('gender_by_store', 'age_by_store', 'menu_by_store')):
+        counts, categories = demographic_counts[column]
+        answered = counts.sum(axis=1) > 0
+        index = pd.Index(store_ids[answered], name='store_id')
+        counts, categories = counts[answered], categories[:counts.shape[1]]
+        if column != 'age_group':
+            present = counts.sum(axis=0) > 0
+            counts, categories = counts[:, present], categories[present]
+        order = category_order(column, categories)
+        tables[key] = pd.DataFrame(counts[:, order], index=index, columns=categories[order])
+    return tables
+
+
+def joint_demographic_counts(codes, store_pos, user_pos, store_ids):
+    """
+    (store_id, gender, age_group, favorite_menu)별 즐겨찾기 수 (세 항목에 모두 응답한 즐겨찾기만)
+    카페 위치와 항목 코드를 정수 하나로 합친 뒤 factorize + bincount로 셈
+    """
+    values = [codes[column][0][user_pos].astype(np.int64) for column in DEMOGRAPHIC_COLUMNS]
+    answered = np.all([value >= 0 for value in values], axis=0)
+    joint = store_pos[answered].astype(np.int64)
+    for column, value in zip(DEMOGRAPHIC_COLUMNS, values):
+        joint = joint * len(codes[column][1]) + value[answered]
+    keys, uniques = pd.factorize(joint, sort=True)
+    counts = np.bincount(keys, minlength=len(uniques))
+
+    # 합친 코드를 카페 위치와 항목별 코드로 되돌림
+    levels = []
+    for column in reversed(DEMOGRAPHIC_COLUMNS):
+        categories = codes[column][1]
+        levels.append(categories[uniques % len(categories)])
+        uniques = uniques // len(categories)
+    index = pd.MultiIndex.from_arrays(
+        [store_ids[uniques], *reversed(levels)], names=['store_id', *DEMOGRAPHIC_COLUMNS]
+    )
+    return pd.Series(counts, index=index).sort_index()
+
+
+def favorites_demographic_table(key):
+    """
+    gender_by_store / age_by_store / menu_by_store 분포 DataFrame
+    (이벤트로 인원표가 바뀐 뒤 처음 조회할 때만 다시 만듦)
+    """
+    get_favorites_index()
+    with _favorites_index_lock:
+        index = _favorites_index['data']
+        if index['demographic_tables'] is None:
+            index['demographic_tables'] = favorites_demographic_tables(
+                index['demographic_counts'], index['store_ids']
             )
-            plt.title('Age Distribution in Nearby Favorite Cafes', fontsize=14)
-            plt.xlabel('Cafe Name', fontsize=12)
-            plt.ylabel('Number of Favorites (People)', fontsize=12)
-            plt.xticks(rotation=45, fontsize=12)
-            plt.legend(title='Age Group', fontsize=12)
-            plt.tight_layout()
-
-            # 이미지 저장
-            plt.savefig(output_path)
-            plt.close()
-            return True
-        else:
-            print("연령대 데이터가 없는 카페가 있어 그래프를 그릴 수 없습니다.")
-            return False
-    except Exception as e:
-        print(f"오류 발생: {e}")
-        return False
+        return index['demographic_tables'][key]
 
 
+def favorites_demographics():
+    """
+    (store_id, gender, age_group, favorite_menu)별 즐겨찾기 수 (추가 이벤트는 조회할 때 한 번에 반영)
+    """
+    get_favorites_index()
+    with _favorites_index_lock:
+        index = _favorites_index['data']
+        deltas = index['demographic_deltas']
+        if deltas:
+            pending = pd.Series(deltas, dtype='int64')
+            pending.index.names = index['demographics'].index.names
+            demographics = index['demographics'].add(pending, fill_value=0).astype('int64')
+            index['demographics'] = demographics[demographics != 0].sort_index()
+            deltas.clear()
+        return index['demographics']
+
+
+def build_favorites_index():
+    """
+    즐겨찾기 집계 인덱스 생성
+    - stores: 카페 행 위치 순 카페 정보 (store_id, name, province, city)
+    - store_ids: 카페 id -> 행 위치 해시 인덱스
+    - favorite_counts: 카페 행 위치별 즐겨찾기 수
+    - ranking_orders / rankings / ranking_totals: favorite_counts로 만든 랭킹 (build_rankings, ranking_frame으로 조회)
+    - demographic_counts: 항목별 (카페 행 위치 x 항목 값 인원 배열, 항목 값 Index)
+    - demographic_tables: demographic_counts로 만든 gender_by_store / age_by_store / menu_by_store
+      (favorites_demographic_table로 조회, 이벤트로 바뀌면 None)
+    - demographics: (store_id, gender, age_group, favorite_menu)별 즐겨찾기 수 (favorites_demographics로 조회)
+    - demographic_deltas: 인덱스 생성 후 이벤트로 바뀐 demographics 값 (조회 시 반영)
+    """
+    ids = get_id_index()
+    store_info = load_dataset(store_info_path, STORE_COLUMNS)
+
+    # 카페별 즐겨찾기 수 (카페 행 위치별 bincount)
+    store_pos = ids['favorite_store_pos']
+    favorite_counts = np.bincount(store_pos[store_pos >= 0], minlength=len(store_info))
+
+    stores = store_info[['id', 'name']].rename(columns={'id': 'store_id'})
+    stores = pd.concat([stores, parse_region(store_info['address'])], axis=1)
+
+    # 즐겨찾기 x 설문 (행 위치로 조인): 양쪽에 모두 있는 즐겨찾기를 항목별로 셈 (응답하지 않은 항목만 제외)
+    codes = ids['demographics']
+    user_pos = ids['favorite_user_pos']
+    matched = (store_pos >= 0) & (user_pos >= 0)
+    crosstabs = demographic_crosstabs(codes, store_pos[matched], user_pos[matched], len(store_info))
+    demographics = joint_demographic_counts(codes, store_pos[matched], user_pos[matched], ids['store_ids'])
+
+    return {
+        'stores': stores,
+        'store_ids': ids['store_ids'],
+        'favorite_counts': favorite_counts,
+        **build_rankings(stores, favorite_counts),
+        'demographic_counts': {column: (crosstabs[column], codes[column][1]) for column in DEMOGRAPHIC_COLUMNS},
+        'demographic_tables': None,
+        'demographics': demographics,
+        'demographic_deltas': collections.Counter(),
+    }
+
+
+def get_favorites_index():
+    """
+    현재 데이터 버전의 즐겨찾기 집계 인덱스 반환 (CSV가 바뀐 경우에만 다시 생성)
+    """
+    version = favorites_data_version()
+    with _favorites_index_lock:
+        if _favorites_index['version'] != version:
+            with span('aggregate'):
+                _favorites_index['data'] = build_favorites_index()
+            _favorites_index['version'] = version
+        return _favorites_index['data']
 
 
-# 요일 순서 지정 및 한글 매핑
-weekday_order = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
-weekday_korean = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
+def clear_favorites_indexes():
+    """
+    id 인덱스와 즐겨찾기 집계 인덱스를 버림 (다음 조회에서 CSV 전체로 다시 생성)
+    """
+    with _favorites_index_lock, _id_index_lock:
+        _id_index.update(version=None, data=None)
+        _favorites_index.update(version=None, data=None)
 
 
-def generate_busiest_and_least_busy_times():
+def age_group_of(age):
     """
-    요일별 가장 붐비는 시간대, 가장 한가한 시간대, 평균 혼잡도 시각화
+    나이를 AGE_LABELS 연령대로 변환 (범위 밖이거나 없으면 NaN)
     """
-    # 데이터 불러오기
-    data = pd.read_csv(file_path)
-    data['weekday'] = pd.Categorical(data['weekday'], categories=weekday_order, ordered=True)
-    data['weekday_korean'] = data['weekday'].map(dict(zip(weekday_order, weekday_korean)))
+    code = age_codes([age])[0]
+    return AGE_LABELS[code] if code >= 0 else np.nan
 
-    # 요일별로 가장 붐비는 시간 찾기
-    busiest_times = data.loc[data.groupby('weekday')['predicted_people'].idxmax()]
-    busiest_times['weekday_korean'] = busiest_times['weekday'].map(dict(zip(weekday_order, weekday_korean)))
 
-    # 요일별로 가장 한가한 시간 찾기
-    least_busy_times = data.loc[data.groupby('weekday')['predicted_people'].idxmin()]
-    least_busy_times['weekday_korean'] = least_busy_times['weekday'].map(dict(zip(weekday_order, weekday_korean)))
+def profile_codes(index, row):
+    """
+    설문 행의 (gender, age_group, favorite_menu) 코드 (응답하지 않은 항목은 -1)
+    """
+    codes = index['demographics']
+    return tuple(int(codes[column][0][row]) for column in DEMOGRAPHIC_COLUMNS)
 
-    # 요일별 평균 혼잡도 계산
-    average_congestion = data.groupby('weekday')['predicted_people'].mean().reset_index()
-    average_congestion['weekday_korean'] = average_congestion['weekday'].map(dict(zip(weekday_order, weekday_korean)))
 
-    # 그래프 1: 가장 붐비는 시간대와 가장 한가한 시간대
-    plt.figure(figsize=(8, 7))
+def append_profile_codes(index, profile):
+    """
+    설문 한 건의 (gender, age_group, favorite_menu)를 코드로 바꿔 설문 행 코드 배열 끝에 붙이고 코드 반환
+    처음 나온 값은 항목 값 Index 끝에 추가
+    """
+    codes = index['demographics']
+    appended = []
+    for column, value in zip(DEMOGRAPHIC_COLUMNS, profile):
+        values, categories = codes[column]
+        code = -1
+        if not pd.isna(value):
+            code = categories.get_indexer([value])[0]
+            if code < 0:
+                code = len(categories)
+                categories = categories.append(pd.Index([value], name=column))
+                if code > np.iinfo(values.dtype).max:
+                    values = values.astype(np.int32)
+        codes[column] = (append_value(index['buffers'], column, values, code), categories)
+        appended.append(code)
+    return tuple(appended)
+
+
+def apply_demographic_delta(index, ids, store_pos, codes, delta):
+    """
+    카페 행 위치별 성별, 연령대, 선호 메뉴 인원 배열에 한 사용자의 프로필 코드를 더하거나 뺌 (응답하지 않은 항목은 건너뜀)
+    세 항목에 모두 응답한 프로필이면 (store_id, gender, age_group, favorite_menu) 집계에도 반영
+    """
+    demographic_counts = index['demographic_counts']
+    for column, code in zip(DEMOGRAPHIC_COLUMNS, codes):
+        if code < 0:
+            continue
+        counts, categories = demographic_counts[column]
+        if code >= counts.shape[1]:
+            # 새 항목 값: id 인덱스의 항목 값에 맞춰 컬럼만 늘림
+            categories = ids['demographics'][column][1]
+            counts = np.pad(counts, ((0, 0), (0, len(categories) - counts.shape[1])))
+            demographic_counts[column] = (counts, categories)
+        counts[store_pos, code] += delta
+
+    if min(codes) >= 0:
+        labels = [demographic_counts[column][1][code] for column, code in zip(DEMOGRAPHIC_COLUMNS, codes)]
+        index['demographic_deltas'][(index['store_ids'][store_pos], *labels)] += delta
+    index['demographic_tables'] = None
+
+
+def apply_favorite_event(ids, index, store_id, user_id):
+    """
+    즐겨찾기 한 건을 id 인덱스(즐겨찾기 행, 카페별 / 사용자별 목록)와
+    집계 인덱스(즐겨찾기 수, 랭킹, 카페별 분포)에 반영 (index가 None이면 id 인덱스만)
+    """
+    store_pos = ids['store_ids'].get_indexer([store_id])[0]
+    user_row = survey_row_of(ids, user_id)
+    row = len(ids['favorite_store_pos'])
+    ids['favorite_store_pos'] = append_value(ids['buffers'], 'favorite_store_pos', ids['favorite_store_pos'], store_pos)
+    ids['favorite_user_pos'] = append_value(ids['buffers'], 'favorite_user_pos', ids['favorite_user_pos'], user_row)
+    ids['appended_by_user'].setdefault(user_id, []).append(row)
+    if store_pos < 0:
+        return
+    ids['appended_by_store'].setdefault(store_pos, []).append(row)
+
+    if index is not None:
+        increment_favorite_count(index, store_pos)
+        if user_row >= 0:
+            apply_demographic_delta(index, ids, store_pos, profile_codes(ids, user_row), 1)
+
+
+def apply_survey_event(ids, index, user_id, profile):
+    """
+    설문 한 건을 반영 (같은 user_id의 이전 설문은 대체)
+    id 인덱스에는 설문 행 코드를 추가하고 사용자의 즐겨찾기 행을 새 설문 행으로 옮기며,
+    집계 인덱스에서는 사용자가 이미 즐겨찾기한 카페들의 분포를 이전 프로필에서 새 프로필로 옮김
+    """
+    previous_row = survey_row_of(ids, user_id)
+    previous = profile_codes(ids, previous_row) if previous_row >= 0 else None
+    row = len(ids['demographics'][DEMOGRAPHIC_COLUMNS[0]][0])
+    current = append_profile_codes(ids, profile)
+    ids['appended_user_rows'][user_id] = row
+
+    rows = user_favorite_rows(ids, user_id)
+    ids['favorite_user_pos'][rows] = row
+    if index is None or previous == current:
+        return
+
+    for store_pos in ids['favorite_store_pos'][rows]:
+        if store_pos < 0:
+            continue
+        if previous is not None:
+            apply_demographic_delta(index, ids, store_pos, previous, -1)
+        apply_demographic_delta(index, ids, store_pos, current, 1)
+
+
+def append_csv_row(path, row):
+    """
+    CSV 파일 끝에 한 행 추가 (컬럼 순서와 줄바꿈 문자는 기존 파일을 따르고, 없는 컬럼은 빈 값)
+    """
+    with open(path, 'rb') as f:
+        header_line = f.readline()
+        needs_newline = False
+        if f.seek(0, os.SEEK_END) > 0:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) not in (b'\n', b'\r')
+
+    newline = '\r\n' if header_line.endswith(b'\r\n') else '\n'
+    header = next(csv.reader([header_line.decode('utf-8-sig').rstrip('\r\n')]))
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator=newline).writerow(
+        ['' if row.get(column) is None else row[column] for column in header]
+    )
+    with open(path, 'a', encoding='utf-8', newline='') as f:
+        f.write((newline if needs_newline else '') + buffer.getvalue())
+
+
+def record_favorites_event(path, row, apply_event):
+    """
+    즐겨찾기/설문 CSV에 한 행을 추가하고, 인덱스가 추가 직전 버전이면 다시 만들지 않고 증분 반영
+    apply_event(ids, index)로 id 인덱스와 집계 인덱스를 함께 갱신 (집계 인덱스가 오래됐으면 index=None)
+    id 인덱스가 없거나 이미 오래됐으면 두 인덱스 모두 다음 조회 때 CSV 전체로 다시 생성
+    """
+    # 잠금 순서는 get_favorites_index(집계 -> id)와 같게
+    with _favorites_index_lock, _id_index_lock:
+        version = favorites_data_version()
+        ids_current = _id_index['version'] == version
+        index_current = ids_current and _favorites_index['version'] == version
+        append_csv_row(path, row)
+        if ids_current:
+            with span('apply_delta'):
+                apply_event(_id_index['data'], _favorites_index['data'] if index_current else None)
+            version = favorites_data_version()
+            _id_index['version'] = version
+            if index_current:
+                _favorites_index['version'] = version
+        increment_counter('favorites_delta_applied' if index_current else 'favorites_delta_deferred')
+
+
+def query_favorites_ranking(province=None, city=None):
+    """
+    지역별 카페 즐겨찾기 랭킹 조회 (province/city가 없으면 전체 랭킹)
+    """
+    get_favorites_index()
+    with _favorites_index_lock:
+        return ranking_frame(_favorites_index['data'], None if province is None else (province, city))
 
-    # 가장 붐비는 시간대
-    plt.bar(busiest_times['weekday_korean'], busiest_times['predicted_people'], color='lightcoral', label='Busiest Time')
-    for i, row in busiest_times.iterrows():
-        plt.text(
-            row['weekday_korean'], 
-            row['predicted_people'] + 0.5,  # 텍스트를 막대 위로 배치
-            f"{int(row['hour'])}o'clock", 
-            ha='center', 
-            va='bottom', 
-            fontsize=14
-        )
 
-    # 가장 한가한 시간대
-    plt.bar(least_busy_times['weekday_korean'], least_busy_times['predicted_people'], color='skyblue', label='Calmest Time')
-    for i, row in least_busy_times.iterrows():
-        plt.text(
-            row['weekday_korean'], 
-            row['predicted_people'] + 0.2,  # 텍스트를 막대 위로 배치
-            f"{int(row['hour'])}o'clock", 
-            ha='center', 
-            va='bottom', 
-            fontsize=14, 
-            color='black',
-            bbox=dict(facecolor='none', edgecolor='none', alpha=0.7)  # 텍스트 배경 추가
-        )
-    plt.title('Busiest and Calmest Time Periods by Day of the Week', fontsize=18)
-    plt.xticks(fontsize=18)
-    plt.xlabel('Week', fontsize=16)
-    plt.ylabel('Congestion', fontsize=16)
-    plt.ylim(0, data['predicted_people'].max() + 2) 
-    plt.legend(fontsize=14)
-    plt.tight_layout()
+def query_favorites_total(province=None, city=None):
+    """
+    지역별 즐겨찾기 합계 (province/city가 없으면 전체, 없는 지역은 0)
+    """
+    get_favorites_index()
+    with _favorites_index_lock:
+        return _favorites_index['data']['ranking_totals'].get(None if province is None else (province, city), 0)
 
-    busiest_and_least_busy_path = os.path.join(STATIC_FOLDER, 'busiest_and_least_busy.png')
-    plt.savefig(busiest_and_least_busy_path)
-    plt.close()
 
-    # 그래프 2: 평균 혼잡도
-    plt.figure(figsize=(7, 5))
-    plt.bar(average_congestion['weekday_korean'], average_congestion['predicted_people'], color='#2E8465', label='average_congestion')
-    plt.title('Average Congestion by Day of the Week', fontsize=18)
-    plt.xticks(fontsize=16)
-    plt.xlabel('Week', fontsize=16)
-    plt.ylabel('Congestion', fontsize=16)
-    plt.ylim(0, data['predicted_people'].max() + 2) 
-    plt.legend(fontsize=16)
-    plt.tight_layout()
+# 주변 카페 공간 인덱스: 위도/경도 격자(셀 크기 SPATIAL_CELL_DEG도)별 카페 위치 목록
+SPATIAL_CELL_DEG = 0.05
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.195
+NEARBY_DEFAULT_RADIUS_KM = 2.0
+NEARBY_MAX_RADIUS_KM = 50.0
+NEARBY_DEFAULT_LIMIT = 50
+NEARBY_MAX_LIMIT = 1000
 
-    average_congestion_path = os.path.join(STATIC_FOLDER, 'average_congestion.png')
-    plt.savefig(average_congestion_path)
-    plt.close()
+_spatial_index = {'version': None, 'data': None}
+_spatial_index_lock = threading.Lock()
 
-    return busiest_and_least_busy_path, average_congestion_path
+
+def build_spatial_index():
+    """
+    카페 위치 격자 인덱스 생성 (카페 정보는 복사하지 않고 카페 테이블 행 위치로 조회)
+    - store_rows: 위치가 있는 카페의 카페 테이블(=즐겨찾기 집계 인덱스) 행 위치
+    - latitude / longitude: 위도, 경도 배열 (라디안)
+    - congestion_level: 정렬용 배열
+    - grid: (위도 셀, 경도 셀) -> 해당 셀의 위치 배열 번호
+    """
+    stores = load_dataset(store_info_path, STORE_COLUMNS)
+    stores = stores.dropna(subset=['latitude', 'longitude'])
+
+    latitude = stores['latitude'].to_numpy(dtype=float)
+    longitude = stores['longitude'].to_numpy(dtype=float)
+    cells = pd.DataFrame({
+        'row': np.floor(latitude / SPATIAL_CELL_DEG).astype(np.int64),
+        'col': np.floor(longitude / SPATIAL_CELL_DEG).astype(np.int64),
+    })
+
+    return {
+        'store_rows': stores.index.to_numpy().astype(np.int32),
+        'latitude': np.radians(latitude),
+        'longitude': np.radians(longitude),
+        'congestion_level': stores['store_congestion_level'].to_numpy(),
+        'grid': cells.groupby(['row', 'col']).indices,
+    }
+
+
+def get_spatial_index():
+    """
+    현재 데이터 버전의 공간 인덱스 반환 (카페 파일이 바뀐 경우에만 다시 생성)
+    """
+    version = dataset_signature(store_info_path)
+    with _spatial_index_lock:
+        if _spatial_index['version'] != version:
+            with span('index'):
+                _spatial_index['data'] = build_spatial_index()
+            _spatial_index['version'] = version
+        return _spatial_index['data']
 
 
-def visualize_favorites_by_store():
-    """
-    특정 카페를 좋아요한 사용자의 성별, 연령대, 선호 메뉴를 시각화합니다.
-    """
-    try:
-        # 데이터 로드
-        store_info = pd.read_csv(store_info_path)
-        favorite_data = pd.read_csv(store_favorite_path)
-        survey_data = pd.read_csv(user_data_path)
-        
-        # 혼잡도 파일의 카페 id를 읽음
-        target_id = int(os.path.basename(file_path).split('.')[0])  # 예: '291.csv' -> 291
-        
-        # store(통합).csv에서 해당 카페 정보 찾기
-        target_store = store_info[store_info['id'] == target_id]
-        if target_store.empty:
-            raise ValueError("해당 ID의 카페가 store(통합).csv에 존재하지 않습니다.")
-        
-        # 좋아요 누른 사용자 id 찾기
-        liked_users = favorite_data[favorite_data['store_id'] == target_id]
-        if liked_users.empty:
-            raise ValueError("해당 카페를 좋아요한 사용자가 없습니다.")
-        
-        # 설문조사 데이터와 매칭
-        liked_user_ids = liked_users['user_id'].unique()
-        matched_survey_data = survey_data[survey_data['user_id'].isin(liked_user_ids)]
-        if matched_survey_data.empty:
-            raise ValueError("해당 사용자의 설문조사 데이터가 없습니다.")
-        
-        # 성별 분포
-        gender_counts = matched_survey_data['gender'].value_counts()
-        gender_counts.plot(kind='bar', color=['lightpink', 'skyblue'], rot=0, title='Gender Distribution')
-        plt.title('Gender Distribution', fontsize=14)  # 제목 폰트 크기 설정
-        plt.xlabel('Gender', fontsize=12)  # x축 폰트 크기 설정
-        plt.ylabel('Number of People', fontsize=12)  # y축 폰트 크기 설정
-        plt.xticks(ticks=range(len(gender_counts)), labels=['Female', 'Male'], fontsize = 12)
-        gender_path = os.path.join(STATIC_FOLDER, 'gender_distribution_target_store.png')
-        plt.savefig(gender_path)
-        plt.close()
-        
-        # 연령대별 분포
-        age_bins = [0, 19, 29, 39, 49, 59, 120]
-        age_labels = ['Under 20s', '20s', '30s', '40s', '50s', '60s and Above']
-        matched_survey_data['age_group'] = pd.cut(matched_survey_data['age'], bins=age_bins, labels=age_labels, right=False)
-        age_counts = matched_survey_data['age_group'].value_counts().sort_index()
-        age_counts.plot(kind='bar', color='#e38a6d', rot=0, title='Age Distribution')
-        plt.rc('font', family='AppleGothic')
-        plt.xticks(fontsize=12)
-        plt.title('Age Distribution', fontsize=14)  # 제목 폰트 크기 설정
-        plt.xlabel('Age', fontsize=12)  # x축 폰트 크기 설정
-        plt.ylabel('Number of People', fontsize=12)  # y축 폰트 크기 설정
-        age_path = os.path.join(STATIC_FOLDER, 'age_distribution_target_store.png')
-        plt.savefig(age_path)
-        plt.close()
-        
-        # 선호 메뉴 분포
-        favorite_menu_counts = matched_survey_data['favorite_menu'].value_counts()
-        favorite_menu_counts.plot(kind='bar', color='#8a6857', rot=45, title='Favorite Menu Distribution')
-        menu_path = os.path.join(STATIC_FOLDER, 'favorite_menu_distribution_target_store.png')
-        plt.xticks(fontsize=12)
-        plt.title('Favorite Menu Distribution', fontsize=14)  # 제목 폰트 크기 설정
-        plt.xlabel('Preference', fontsize=12)  # x축 폰트 크기 설정
-        plt.ylabel('Number of People', fontsize=12)  # y축 폰트 크기 설정
-        plt.savefig(menu_path, bbox_inches='tight')
-        plt.close()
-        
-        return gender_path, age_path, menu_path
-    
-    except Exception as e:
-        raise RuntimeError(f"데이터 시각화 중 오류 발생: {e}")
+def haversine_km(lat, lon, latitudes, longitudes):
+    """
+    한 지점(라디안)과 여러 지점(라디안 배열) 사이의 대원 거리(km)
+    """
+    a = (
+        np.sin((latitudes - lat) / 2) ** 2
+        + np.cos(lat) * np.cos(latitudes) * np.sin((longitudes - lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
 
 
-@app.route('/api/get-calmcafe-data-image', methods=['GET'])
-def get_target_store_visualization():
-    try:
-        # 타겟 카페의 성별, 연령대, 선호 메뉴 시각화 이미지 생성
-        gender_path, age_path, menu_path = visualize_favorites_by_store()
-        
-        # 요일별 가장 붐비는 시간대와 평균 혼잡도 이미지 생성
-        busiest_and_least_busy_path, average_congestion_path = generate_busiest_and_least_busy_times()
+def nearby_positions(lat, lon, radius_km):
+    """
+    반경 radius_km 안의 카페 행 위치, 거리(km), 즐겨찾기 수 배열 (즐겨찾기 많은 순, 혼잡도 낮은 순, 가까운 순)
+    """
+    index = get_spatial_index()
+    grid = index['grid']
+
+    # 반경을 덮는 셀 범위
+    lat_span = radius_km / KM_PER_DEGREE
+    lon_span = radius_km / (KM_PER_DEGREE * max(np.cos(np.radians(lat)), 1e-6))
+    row_min, row_max = int(np.floor((lat - lat_span) / SPATIAL_CELL_DEG)), int(np.floor((lat + lat_span) / SPATIAL_CELL_DEG))
+    col_min, col_max = int(np.floor((lon - lon_span) / SPATIAL_CELL_DEG)), int(np.floor((lon + lon_span) / SPATIAL_CELL_DEG))
+
+    if (row_max - row_min + 1) * (col_max - col_min + 1) <= len(grid):
+        candidates = [
+            grid[(row, col)]
+            for row in range(row_min, row_max + 1)
+            for col in range(col_min, col_max + 1)
+            if (row, col) in grid
+        ]
+    else:
+        # 반경이 매우 넓으면 셀 목록을 직접 훑는 쪽이 빠름
+        candidates = [
+            positions for (row, col), positions in grid.items()
+            if row_min <= row <= row_max and col_min <= col <= col_max
+        ]
+
+    positions = np.concatenate(candidates) if candidates else np.array([], dtype=np.int64)
+    distances = haversine_km(
+        np.radians(lat), np.radians(lon), index['latitude'][positions], index['longitude'][positions]
+    )
+    within = distances <= radius_km
+    positions, distances = positions[within], distances[within]
+    favorite_counts = get_favorites_index()['favorite_counts'][index['store_rows'][positions]]
+
+    # np.lexsort는 마지막 키가 1순위
+    order = np.lexsort((
+        distances, index['congestion_level'][positions], -favorite_counts
+    ))
+    return index, positions[order], distances[order], favorite_counts[order]
+
+
+def query_nearby_stores(lat, lon, radius_km=NEARBY_DEFAULT_RADIUS_KM, limit=None):
+    """
+    반경 radius_km 안의 카페 조회 (격자 셀로 후보를 좁힌 뒤 거리 계산)
+    반환값: 카페 정보 + distance_km + favorite_count DataFrame (즐겨찾기 많은 순, 혼잡도 낮은 순, 가까운 순)
+    """
+    index, positions, distances, favorite_counts = nearby_positions(lat, lon, radius_km)
+    if limit is not None:
+        positions, distances, favorite_counts = positions[:limit], distances[:limit], favorite_counts[:limit]
 
-        # 성별 분포 이미지 생성
-        gender_distribution_path = os.path.join(STATIC_FOLDER, 'gender_distribution.png')
-        success_gender = generate_gender_distribution_image(gender_distribution_path)
-        
-        # 연령대 분포 이미지 생성
-        age_distribution_path = os.path.join(STATIC_FOLDER, 'age_distribution.png')
-        success_age = generate_age_distribution_image(age_distribution_path)
+    stores = load_dataset(store_info_path, STORE_COLUMNS)
+    nearby = stores.iloc[index['store_rows'][positions]].reset_index(drop=True).rename(columns={'id': 'store_id'})
+    nearby['distance_km'] = distances.round(3)
+    nearby['favorite_count'] = favorite_counts
+    return nearby
 
-        if not (success_gender and success_age):
-            raise ValueError("성별 또는 연령대 분포 이미지를 생성하는 데 실패했습니다.")
 
-        # 모든 이미지 URL 반환
-        return jsonify({
-            "genderImageUrl": f"{BASE_URL}/static/gender_distribution_target_store.png",
-            "ageImageUrl": f"{BASE_URL}/static/age_distribution_target_store.png",
-            "menuImageUrl": f"{BASE_URL}/static/favorite_menu_distribution_target_store.png",
-            "busiestAndLeastBusyImageUrl": f"{BASE_URL}/static/busiest_and_least_busy.png",
-            "averageCongestionImageUrl": f"{BASE_URL}/static/average_congestion.png",
-            "genderDistributionImageUrl": f"{BASE_URL}/static/gender_distribution.png?cache_buster=12345",
-            "ageDistributionImageUrl": f"{BASE_URL}/static/age_distribution.png"
-        })
+def query_nearby_ranking(lat, lon, radius_km=NEARBY_DEFAULT_RADIUS_KM):
+    """
+    반경 안에서 즐겨찾기가 있는 카페 랭킹 (store_id, name, favorite_count)
+    """
+    nearby = query_nearby_stores(lat, lon, radius_km)
+    nearby = nearby[nearby['favorite_count'] > 0]
+    return nearby.sort_values(by='favorite_count', ascending=False, kind='stable')[
+        ['store_id', 'name', 'favorite_count']
+    ]
 
-    except Exception as e:
-        return Response(
-            json.dumps({"error": f"시각화 오류: {str(e)}"}, ensure_ascii=False),
-            content_type="application/json; charset=utf-8",
-            status=500,
-        )
 
+def parse_nearby_args(args):
+    """
+    요청 파라미터 lat, lon, radius(km)를 (lat, lon, radius_km)로 변환 (lat/lon이 없으면 None)
+    """
+    if args.get('lat') is None and args.get('lon') is None:
+        return None
+    try:
+        lat = float(args['lat'])
+        lon = float(args['lon'])
+        radius_km = float(args.get('radius', NEARBY_DEFAULT_RADIUS_KM))
+    except (KeyError, ValueError):
+        raise ValueError("lat, lon, radius는 숫자여야 하며 lat과 lon은 함께 지정해야 합니다.")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("lat/lon 범위가 올바르지 않습니다.")
+    if not (0 < radius_km <= NEARBY_MAX_RADIUS_KM):
+        raise ValueError(f"radius는 0보다 크고 {NEARBY_MAX_RADIUS_KM:g}km 이하여야 합니다.")
+    return lat, lon, radius_km
+
+
+# 랭킹 이미지: 한 줄에 한 카페, 줄 수에 맞춰 높이 조정 (검은 글자/흰 배경이라 회색조로 그림)
+RANKING_FONT_PATH = {
+    'Darwin': "/Library/Fonts/AppleSDGothicNeo.ttc",  # macOS
+    'Windows': "C:\\Windows\\Fonts\\malgun.ttf",  # Windows
+}.get(platform.system(), "/usr/share/fonts/truetype/nanum/NanumGothic.ttf")  # Linux에서 사용하는 한글 폰트
+RANKING_FONT_SIZE = 20
+RANKING_IMAGE_WIDTH = 800
+RANKING_IMAGE_MARGIN = 50
+RANKING_ROW_HEIGHT = 30
+RANKING_PAGE_SIZE = 20
+RANKING_MAX_PAGE_SIZE = 100
+
+# 출력 형식: png(16단계 회색 팔레트 PNG) 또는 webp, 압축 설정은 환경 변수로 조정
+RANKING_IMAGE_FORMAT = os.getenv("RANKING_IMAGE_FORMAT", "png")
+RANKING_IMAGE_EXTENSIONS = {'png': 'png', 'webp': 'webp'}
+RANKING_PNG_COMPRESS_LEVEL = int(os.getenv("RANKING_PNG_COMPRESS_LEVEL", 6))  # 0(빠름)~9(작음)
+RANKING_WEBP_QUALITY = int(os.getenv("RANKING_WEBP_QUALITY", 80))  # 100이면 무손실
+RANKING_WEBP_METHOD = int(os.getenv("RANKING_WEBP_METHOD", 0))  # 0(빠름)~6(작음)
+
+# 회색조 256단계 -> 16단계 팔레트 색인
+RANKING_GRAY_LEVELS = 16
+RANKING_GRAY_LUT = [value * RANKING_GRAY_LEVELS // 256 for value in range(256)]
+RANKING_GRAY_PALETTE = [
+    channel
+    for level in range(RANKING_GRAY_LEVELS)
+    for channel in (level * 255 // (RANKING_GRAY_LEVELS - 1),) * 3
+]
+
+
+@functools.lru_cache(maxsize=None)
+def ranking_font(size=RANKING_FONT_SIZE):
+    """
+    크기별로 한 번만 로드한 랭킹 이미지 폰트
+    """
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.truetype(RANKING_FONT_PATH, size)
+    except IOError:
+        # 폰트 로드 실패 시 기본 폰트 사용
+        return ImageFont.load_default()
 
 
-# static 디렉토리의 파일을 클라이언트가 접근할 수 있게 설정
-@app.route('/static/<path:filename>')
-def serve_static(filename):
-    return send_from_directory(STATIC_FOLDER, filename)
+@functools.lru_cache(maxsize=32)
+def ranking_canvas(height):
+    """
+    높이별 흰 배경 캔버스 (호출한 쪽에서 copy()해서 사용)
+    """
+    from PIL import Image
 
-@app.route('/static/<filename>')
-def serve_image(filename):
-    return send_file(f'./static/{filename}', mimetype='image/png')
+    return Image.new("L", (RANKING_IMAGE_WIDTH, height), color=255)
 
-@app.route('/favicon.ico')
-def favicon():
-    return '', 404  # 빈 응답을 반환하여 404 오류 처리
 
+def ranking_image_params(start_rank=1, image_format=RANKING_IMAGE_FORMAT):
+    """
+    랭킹 이미지 렌더링 파라미터 (캐시 키에 포함)
+    """
+    if image_format not in RANKING_IMAGE_EXTENSIONS:
+        raise ValueError(f"format은 {', '.join(RANKING_IMAGE_EXTENSIONS)} 중 하나여야 합니다.")
+    params = {'start_rank': start_rank, 'image_format': image_format}
+    if image_format == 'png':
+        params['compress_level'] = RANKING_PNG_COMPRESS_LEVEL
+    else:
+        params.update(quality=RANKING_WEBP_QUALITY, method=RANKING_WEBP_METHOD)
+    return params
+
+
+def create_image_with_text(data, output_path, start_rank=1, image_format='png', **save_options):
+    """
+    데이터 리스트를 이미지에 텍스트로 렌더링 (순위는 start_rank부터, 높이는 줄 수에 맞춤)
+    save_options: png는 compress_level, webp는 quality, method
+    """
+    from PIL import ImageDraw
+
+    height = 2 * RANKING_IMAGE_MARGIN + max(len(data), 1) * RANKING_ROW_HEIGHT
+    font = ranking_font(RANKING_FONT_SIZE)
+
+    # 캐시된 캔버스 복사본에 그리기
+    img = ranking_canvas(height).copy()
+    draw = ImageDraw.Draw(img)
+
+    # 텍스트 내용 작성
+    x, y = RANKING_IMAGE_MARGIN, RANKING_IMAGE_MARGIN
+    for rank, item in enumerate(data, start=start_rank):
+        text = f"{rank}. {item['name']} - {item['favorite_count']}"
+        draw.text((x, y), text, fill=0, font=font)
+        y += RANKING_ROW_HEIGHT
+
+    # 이미지 저장
+    with span('save'):
+        if image_format == 'webp':
+            quality = save_options.get('quality', RANKING_WEBP_QUALITY)
+            img.save(
+                output_path, format='WEBP', quality=quality, lossless=quality >= 100,
+                method=save_options.get('method', RANKING_WEBP_METHOD),
+            )
+        else:
+            # 16단계 회색 팔레트(4비트)로 줄여 인코딩할 데이터를 줄임
+            img = img.point(RANKING_GRAY_LUT)
+            img.putpalette(RANKING_GRAY_PALETTE)
+            img.save(
+                output_path, format='PNG', bits=4,
+                compress_level=save_options.get('compress_level', RANKING_PNG_COMPRESS_LEVEL),
+            )
+
+
+def ranking_image_path(name, rows, params):
+    """
+    랭킹 페이지 이미지의 static 기준 상대 경로 (내용 주소 기반, 렌더링 전에도 알 수 있음)
+    """
+    key = chart_cache_key(name, rows, params)
+    return f"charts/{chart_filename(name, key, RANKING_IMAGE_EXTENSIONS[params['image_format']])}"
+
+
+def render_ranking_image(name, rows, params):
+    """
+    랭킹 페이지 이미지 렌더링 (같은 내용의 파일이 있으면 다시 그리지 않음)
+    rows: name, favorite_count 컬럼 DataFrame
+    """
+    relative_path = ranking_image_path(name, rows, params)
+    output_path = os.path.join(STATIC_FOLDER, relative_path)
+    if touch_chart(output_path):
+        increment_counter('chart_cache_hit')
+        return relative_path
+    increment_counter('chart_cache_miss')
+
+    # 임시 파일에 그린 뒤 교체해 다른 요청이 그리다 만 파일을 받지 않게 함
+    temp_path = f"{output_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        with span('render'):
+            create_image_with_text(rows.to_dict(orient='records'), temp_path, **params)
+        os.replace(temp_path, output_path)
+    except Exception:
+        remove_temp_chart(temp_path)
+        raise
+    prune_chart_versions(name, ext=RANKING_IMAGE_EXTENSIONS[params['image_format']])
+    return relative_path
+
+
+def parse_ranking_image_args(args):
+    """
+    요청 파라미터 page(1부터), page_size, format을 (page, page_size, image_format)으로 변환
+    """
+    try:
+        page = int(args.get('page', 1))
+        page_size = int(args.get('page_size', RANKING_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("page와 page_size는 정수여야 합니다.")
+    if page < 1 or not (1 <= page_size <= RANKING_MAX_PAGE_SIZE):
+        raise ValueError(f"page는 1 이상, page_size는 1~{RANKING_MAX_PAGE_SIZE} 사이여야 합니다.")
+    image_format = args.get('format', RANKING_IMAGE_FORMAT).lower()
+    if image_format not in RANKING_IMAGE_EXTENSIONS:
+        raise ValueError(f"format은 {', '.join(RANKING_IMAGE_EXTENSIONS)} 중 하나여야 합니다.")
+    return page, page_size, image_format
+
+
+def query_gyeonggi_favorites():
+    """
+    경기도 카페 즐겨찾기 랭킹을 프로세스 내에서 조회 (store_id, name, favorite_count)
+    """
+    return query_favorites_ranking('경기도')[['store_id', 'name', 'favorite_count']]
+
+
+def fetch_gyeonggi_ranking(api_url=None):
+    """
+    경기도 카페 랭킹을 DataFrame으로 가져옴
+    api_url이 없으면 프로세스 내에서 직접 계산하고, 있으면 원격 서버에서 가져옴 (분리 배포용)
+    """
+    if not api_url:
+        return query_gyeonggi_favorites()
+
+    import requests
+
+    with span('remote_fetch'):
+        response = requests.get(api_url, timeout=10)
+    if response.status_code != 200:
+        raise ValueError("API에서 데이터를 가져오지 못했습니다.")
+    return pd.DataFrame(response.json())
+
+
+@app.route('/api/gyeonggi-favorites-image', methods=['GET'])
+def get_gyeonggi_favorites_image():
+    """
+    API to generate an image of cafe rankings in Gyeonggi-do (paginated with page and page_size).
+    """
+    try:
+        page, page_size, image_format = parse_ranking_image_args(request.args)
+    except ValueError as e:
+        return json_error(str(e), status=400)
+
+    try:
+        ranking = query_gyeonggi_favorites()[['name', 'favorite_count']]
+        total_pages = max(1, -(-len(ranking) // page_size))
+        if page > total_pages:
+            return json_error(f"page는 {total_pages} 이하여야 합니다.", status=404)
+
+        start = (page - 1) * page_size
+        rows = ranking.iloc[start:start + page_size].reset_index(drop=True)
+        name = 'gyeonggi_favorites' if page == 1 else f'gyeonggi_favorites_p{page}'
+        params = ranking_image_params(start_rank=start + 1, image_format=image_format)
+        pagination = {"page": page, "pageSize": page_size, "totalPages": total_pages, "totalCount": len(ranking)}
+
+        # 작업 모드: 아직 없는 이미지는 작업 큐에 넘기고 작업 ID를 바로 반환
+        relative_path = ranking_image_path(name, rows, params)
+        if wants_async_render() and not os.path.exists(os.path.join(STATIC_FOLDER, relative_path)):
+            job_id = submit_render_job(
+                relative_path,
+                lambda: ({"imageUrl": render_ranking_image(name, rows, params)}, {}),
+                {"imageUrl": relative_path},
+            )
+            return accepted_job_response(job_id)
+
+        # 이미지 생성
+        relative_path = render_ranking_image(name, rows, params)
+
+        # 이미지 URL 반환
+        return jsonify({"imageUrl": chart_url(relative_path), **pagination})
+
+    except Exception as e:
+        return json_error(str(e))
+
+
+# 랭킹 JSON: limit/cursor 페이지, top-K, 전체 내보내기(스트리밍), 짧은 TTL 캐시 + ETag
+RANKING_MAX_LIMIT = 1000
+RANKING_CACHE_TTL = 5  # 초 (앱이 자주 조회하는 top-10 목록용)
+RANKING_STREAM_CHUNK = 1000  # 스트리밍 시 한 번에 직렬화하는 행 수
+RANKING_CACHE_ENTRIES = 256  # 캐시하는 페이지 응답 수 (LRU)
+# 페이지 응답을 구분하는 요청 파라미터 (다른 파라미터는 캐시 키와 Link 헤더에서 제외)
+RANKING_PAGE_KEYS = ('province', 'city')
+
+_ranking_responses = {'version': None, 'entries': collections.OrderedDict()}
+_ranking_responses_lock = threading.Lock()
+
+
+def encode_ranking_cursor(favorite_count, store_id):
+    """
+    페이지 커서: 마지막 행의 정렬 키 (즐겨찾기 수, store_id) (즐겨찾기가 추가돼도 위치가 밀리지 않음)
+    """
+    return base64.urlsafe_b64encode(f"{favorite_count}:{store_id}".encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_ranking_cursor(cursor):
+    """
+    페이지 커서를 (즐겨찾기 수, store_id)로 변환 (형식이 틀리면 ValueError)
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        favorite_count, store_id = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8').split(':')
+        return int(favorite_count), int(store_id)
+    except (ValueError, UnicodeError):
+        raise ValueError("cursor 형식이 올바르지 않습니다.")
+
+
+def ranking_cursor_position(ranking, cursor):
+    """
+    정렬된 랭킹(즐겨찾기 수 내림차순, store_id 오름차순)에서 커서 다음 행의 위치 (이진 탐색)
+    """
+    favorite_count, store_id = cursor
+    counts = -ranking['favorite_count'].to_numpy()
+    low = np.searchsorted(counts, -favorite_count, side='left')
+    high = np.searchsorted(counts, -favorite_count, side='right')
+    return low + np.searchsorted(ranking['store_id'].to_numpy()[low:high], store_id, side='right')
+
+
+def parse_ranking_page_args(args):
+    """
+    요청 파라미터 limit(또는 top), cursor, format(json/ndjson), stream을 변환
+    limit과 cursor가 모두 없으면 limit은 None (전체 목록)
+    """
+    limit = args.get('limit', args.get('top'))
+    cursor = args.get('cursor') or None
+    try:
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        raise ValueError("limit(top)은 정수여야 합니다.")
+    if limit is not None and not 1 <= limit <= RANKING_MAX_LIMIT:
+        raise ValueError(f"limit(top)은 1~{RANKING_MAX_LIMIT} 사이여야 합니다.")
+    if cursor is not None and limit is None:
+        limit = RANKING_MAX_LIMIT
+
+    output_format = args.get('format', '').lower()
+    if not output_format:
+        output_format = 'ndjson' if 'application/x-ndjson' in request.headers.get('Accept', '') else 'json'
+    if output_format not in ('json', 'ndjson'):
+        raise ValueError("format은 json, ndjson 중 하나여야 합니다.")
+    stream = output_format == 'ndjson' or args.get('stream', '').lower() in ('1', 'true', 'yes')
+    return {
+        'limit': limit,
+        'cursor': decode_ranking_cursor(cursor) if cursor else None,
+        'format': output_format,
+        'stream': stream,
+    }
+
+
+def stream_ranking(rows, output_format):
+    """
+    랭킹 전체를 나눠 직렬화하며 스트리밍 (NDJSON: 한 줄에 한 카페, JSON: 배열)
+    """
+    def generate():
+        if output_format == 'json':
+            yield '['
+        for start in range(0, len(rows), RANKING_STREAM_CHUNK):
+            records = rows.iloc[start:start + RANKING_STREAM_CHUNK].to_dict(orient='records')
+            lines = [json.dumps(record, ensure_ascii=False) for record in records]
+            if output_format == 'json':
+                yield (',' if start else '') + ','.join(lines)
+            else:
+                yield '\n'.join(lines) + '\n'
+        if output_format == 'json':
+            yield ']'
+
+    mimetype = 'application/x-ndjson' if output_format == 'ndjson' else 'application/json'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def ranking_page_response(ranking, columns, page):
+    """
+    랭킹 한 페이지 응답 (본문은 목록, 다음 페이지는 X-Next-Cursor / Link 헤더)
+    같은 데이터 버전의 같은 요청은 직렬화한 본문을 재사용하고, 클라이언트에는 짧은 TTL과 ETag로 캐시 허용
+    """
+    version = favorites_data_version()
+    filters = {key: request.args[key] for key in RANKING_PAGE_KEYS if request.args.get(key)}
+    cursor = request.args.get('cursor') or None
+    cache_key = (request.path, tuple(filters.items()), page['limit'], cursor)
+    with _ranking_responses_lock:
+        if _ranking_responses['version'] != version:
+            _ranking_responses['version'] = version
+            _ranking_responses['entries'] = collections.OrderedDict()
+        entries = _ranking_responses['entries']
+        cached = entries.get(cache_key)
+        if cached is not None:
+            entries.move_to_end(cache_key)
+
+    if cached is None:
+        start = ranking_cursor_position(ranking, page['cursor']) if page['cursor'] else 0
+        rows = ranking.iloc[start:start + page['limit']]
+        body = jsonify(rows[columns].to_dict(orient='records')).get_data()
+        headers = {'X-Total-Count': str(len(ranking))}
+        if start + page['limit'] < len(ranking):
+            last = rows.iloc[-1]
+            next_cursor = encode_ranking_cursor(int(last['favorite_count']), int(last['store_id']))
+            query = urllib.parse.urlencode({**filters, 'limit': page['limit'], 'cursor': next_cursor})
+            headers['X-Next-Cursor'] = next_cursor
+            headers['Link'] = f'<{BASE_URL}{request.path}?{query}>; rel="next"'
+        cached = (body, hashlib.sha256(body).hexdigest()[:20], headers)
+        with _ranking_responses_lock:
+            if _ranking_responses['version'] == version:
+                entries = _ranking_responses['entries']
+                entries[cache_key] = cached
+                while len(entries) > RANKING_CACHE_ENTRIES:
+                    entries.popitem(last=False)
+        increment_counter('ranking_response_miss')
+    else:
+        increment_counter('ranking_response_hit')
+
+    body, etag, headers = cached
+    response = Response(body, mimetype='application/json')
+    response.headers.update(headers)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = RANKING_CACHE_TTL
+    return response.make_conditional(request)
+
+
+def ranking_response(ranking, columns, total_favorites):
+    """
+    랭킹 엔드포인트 공통 응답: 전체 목록(기본), 페이지(limit/top, cursor), 스트리밍(format=ndjson, stream=1)
+    지역 즐겨찾기 합계는 X-Total-Favorites 헤더로
+    """
+    try:
+        page = parse_ranking_page_args(request.args)
+    except ValueError as e:
+        return json_error(str(e), status=400)
+
+    if page['stream']:
+        response = stream_ranking(ranking[columns], page['format'])
+    elif page['limit'] is not None:
+        response = ranking_page_response(ranking, columns, page)
+    else:
+        response = make_response(jsonify(ranking[columns].to_dict(orient='records')))
+        response.headers['Cache-Control'] = 'no-store'  # 캐시 비활성화
+    response.headers['X-Total-Favorites'] = str(total_favorites)
+    return response
+
+
+@app.route('/api/gyeonggi-favorites', methods=['GET'])
+def get_gyeonggi_favorites():
+    """
+    API to return cafe rankings in Gyeonggi-do as JSON data (limit/top, cursor, format=ndjson, stream=1).
+    """
+    try:
+        return ranking_response(
+            query_gyeonggi_favorites(), ['store_id', 'name', 'favorite_count'], query_favorites_total('경기도')
+        )
+
+    except Exception as e:
+        return json_error(str(e))
+
+@app.route('/api/favorites-ranking', methods=['GET'])
+def get_favorites_ranking():
+    """
+    API to return cafe rankings filtered by region (province, city) as JSON data with the region's favorite total in X-Total-Favorites (limit/top, cursor, format=ndjson, stream=1).
+    """
+    province = request.args.get('province') or None
+    city = request.args.get('city') or None
+    if city and not province:
+        return json_error("city를 지정하려면 province도 필요합니다.", status=400)
+
+    try:
+        return ranking_response(
+            query_favorites_ranking(province, city),
+            ['store_id', 'name', 'province', 'city', 'favorite_count'],
+            query_favorites_total(province, city),
+        )
+
+    except Exception as e:
+        return json_error(str(e))
+
+def load_ranking(api_url=None):
+    """
+    랭킹 데이터를 가져와 카페 id(id 컬럼)를 붙여 반환
+    """
+    api_data = fetch_gyeonggi_ranking(api_url)
+
+    if 'store_id' in api_data.columns:
+        # 프로세스 내 랭킹은 store_id를 그대로 사용
+        return api_data.rename(columns={'store_id': 'id'})
+
+    # store_id가 없는 이전 버전 원격 서버 호환: 이름이 유일한 카페만 사전 계산된 이름 인덱스로 매칭
+    name_to_id = get_id_index()['name_to_id']
+    api_data['id'] = api_data['name'].str.strip().str.lower().map(name_to_id)
+    return api_data
+
+def preprocess_data(api_url, user_data_path, store_favorite_path, store_info_path):
+    """
+    데이터를 API 및 파일에서 병합하고 정리
+    """
+    try:
+        # 랭킹 데이터 가져오기 (api_url이 없으면 프로세스 내 계산)
+        merged_api_data = load_ranking(api_url)
+
+        # 데이터 파일 읽기 (다른 집계와 같은 컬럼 캐시를 공유)
+        user_data = load_dataset(user_data_path, SURVEY_COLUMNS)
+        store_favorite = load_dataset(store_favorite_path, FAVORITE_COLUMNS)
+
+        return user_data, store_favorite, merged_api_data
+    except Exception as e:
+        print(f"데이터 처리 오류: {e}")
+        return None, None, None
+
+
+def nearby_favorites_ranking(nearby=None):
+    """
+    주변 카페 랭킹: nearby=(lat, lon, radius_km)이면 반경 내 랭킹, 없으면 경기도 랭킹 (id 컬럼 포함)
+    """
+    if nearby is None:
+        return load_ranking(RANKING_API_URL)
+    return query_nearby_ranking(*nearby).rename(columns={'store_id': 'id'})
+
+
+def save_figure(fig, output_path, tight_layout=False, **kwargs):
+    """
+    차트 저장 (레이아웃 계산과 PNG 인코딩을 각각 layout, save 단계로 계측)
+    """
+    if tight_layout:
+        with span('layout'):
+            fig.tight_layout()
+    with span('save'):
+        fig.savefig(output_path, **kwargs)
+
+
+def gender_distribution_data(nearby=None):
+    """
+    랭킹에 포함된 카페별 성별 분포 데이터 (index: 카페 이름, columns: 남, 여)
+    """
+    api_data = nearby_favorites_ranking(nearby)
+
+    # 랭킹에 포함된 카페의 성별 분포 조회 (사전 집계된 인덱스 사용)
+    gender_distribution = api_data[['name', 'favorite_count', 'id']].join(
+        favorites_demographic_table('gender_by_store'), on='id', how='inner'
+    )
+    gender_distribution.set_index('name', inplace=True)
+    return gender_distribution.reindex(columns=['남', '여'], fill_value=0)
+
+
+def draw_gender_distribution(gender_distribution, output_path):
+    """
+    카페별 성별 분포 누적 막대 그래프 저장
+    """
+    fig = chart_figure(figsize=DEFAULT_FIGSIZE)
+    ax = fig.subplots()
+    gender_distribution[['남', '여']].plot(kind='bar', stacked=True, color=['skyblue', 'pink'], ax=ax)
+    ax.set_title('Gender Distribution in Nearby Favorite Cafes', fontsize=14)
+    ax.set_xlabel('Cafe Name', fontsize=12)
+    ax.set_ylabel('Number of Favorites (People)', fontsize=12)
+    ax.tick_params(axis='x', labelrotation=55, labelsize=12)
+    ax.legend(title='Gender', labels=['Male', 'Female'], fontsize=12)
+    save_figure(fig, output_path, tight_layout=True)
+
+
+def generate_gender_distribution_image(output_path):
+    """
+    성별 분포 그래프를 생성하고 이미지를 저장
+    """
+    try:
+        gender_distribution = gender_distribution_data()
+
+        # 그래프 생성
+        if not gender_distribution.empty:
+            draw_gender_distribution(gender_distribution, output_path)
+            return True
+        else:
+            print("성별 데이터가 부족합니다.")
+            return False
+    except Exception as e:
+        print(f"성별 분포 그래프 생성 오류: {e}")
+        return False
+
+
+def age_distribution_data(nearby=None):
+    """
+    랭킹에 포함된 카페별 연령대 분포 데이터 (index: 카페 이름, columns: AGE_LABELS)
+    """
+    df_api = nearby_favorites_ranking(nearby)
+
+    # 랭킹에 포함된 카페의 연령대 분포 조회 (사전 집계된 인덱스 사용)
+    age_distribution = df_api[['name', 'favorite_count', 'id']].join(
+        favorites_demographic_table('age_by_store'), on='id', how='inner'
+    )
+
+    # 데이터 정리
+    age_distribution['favorite_count'] = pd.to_numeric(age_distribution['favorite_count'], errors='coerce')
+    age_distribution = age_distribution.dropna()
+    age_distribution.set_index('name', inplace=True)
+    return age_distribution[AGE_LABELS]
+
+
+def draw_age_distribution(age_distribution, output_path):
+    """
+    카페별 연령대 분포 누적 막대 그래프 저장
+    """
+    age_colors = ['#f09e90', '#edd75f', '#67c967', '#5c95cc', '#faa7d4', '#c4a6e0']
+
+    fig = chart_figure(figsize=DEFAULT_FIGSIZE)
+    ax = fig.subplots()
+    age_distribution[AGE_LABELS].plot(
+        kind='bar', stacked=True, color=age_colors, ax=ax
+    )
+    ax.set_title('Age Distribution in Nearby Favorite Cafes', fontsize=14)
+    ax.set_xlabel('Cafe Name', fontsize=12)
+    ax.set_ylabel('Number of Favorites (People)', fontsize=12)
+    ax.tick_params(axis='x', labelrotation=45, labelsize=12)
+    ax.legend(title='Age Group', fontsize=12)
+
+    # 이미지 저장
+    save_figure(fig, output_path, tight_layout=True)
+
+
+def generate_age_distribution_image(output_path):
+    """
+    연령대 분포 그래프를 생성하고 이미지를 저장
+    """
+    try:
+        age_distribution = age_distribution_data()
+
+        if not age_distribution.empty:
+            draw_age_distribution(age_distribution, output_path)
+            return True
+        else:
+            print("연령대 데이터가 없는 카페가 있어 그래프를 그릴 수 없습니다.")
+            return False
+    except Exception as e:
+        print(f"오류 발생: {e}")
+        return False
+
+
+
+
+# 요일 순서 지정 및 한글 매핑
+weekday_order = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+weekday_korean = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
+
+
+# 혼잡도 집계 인덱스: 혼잡도 파일 버전별로 한 번만 생성
+_congestion_index = {'version': None, 'data': None}
+_congestion_index_lock = threading.Lock()
+
+
+def congestion_source_paths():
+    """
+    혼잡도 데이터 파일 목록: 통합 테이블(congestion.csv)과 기존 카페별 파일(<id>.csv)
+    """
+    paths = [congestion_path] if os.path.exists(congestion_path) else []
+    for path in sorted(glob.glob(os.path.join(DATA_DIR, '*.csv'))):
+        if os.path.splitext(os.path.basename(path))[0].isdigit():
+            paths.append(path)
+    return paths
+
+
+def load_congestion_table():
+    """
+    모든 카페의 예측 혼잡도를 하나의 테이블로 합침 (store_id, weekday, hour, predicted_people)
+    카페별 파일의 값이 통합 테이블보다 우선함
+    """
+    frames = []
+    for path in congestion_source_paths():
+        if path == congestion_path:
+            data = load_dataset(path, ['store_id', 'weekday', 'hour', 'predicted_people'])
+        else:
+            data = load_dataset(path, ['weekday', 'hour', 'predicted_people'])
+            data['store_id'] = int(os.path.splitext(os.path.basename(path))[0])
+        frames.append(data[['store_id', 'weekday', 'hour', 'predicted_people']])
+
+    if not frames:
+        return pd.DataFrame(columns=['store_id', 'weekday', 'hour', 'predicted_people'])
+    return pd.concat(frames, ignore_index=True).drop_duplicates(
+        subset=['store_id', 'weekday', 'hour'], keep='last'
+    )
+
+
+def consolidate_congestion_files(output_path=None):
+    """
+    카페별 혼잡도 파일을 통합 테이블 하나로 저장 (이후 카페별 파일 없이 운영 가능)
+    """
+    output_path = output_path or congestion_path
+    table = load_congestion_table().sort_values(['store_id', 'weekday', 'hour'])
+    table.to_csv(output_path, index=False)
+    return output_path
+
+
+CONGESTION_HOURS = 24
+CONGESTION_PERCENTILES = (25, 50, 75, 90)
+CONGESTION_WINDOW_HOURS = 3
+
+
+def build_congestion_index():
+    """
+    모든 카페의 혼잡도를 (카페 x 요일 x 시간) 배열 하나로 만들고 요일별 집계를 배열 연산으로 계산
+    - store_ids: 카페 id -> 배열 첫 번째 축 위치 해시 인덱스
+    - people: (카페 수, 7, 24) 예측 혼잡도 (데이터가 없는 시간은 NaN), 요일은 weekday_order 순
+    - observed: (카페 수, 7) 요일별 데이터 유무
+    - busiest_hour / calmest_hour: (카페 수, 7) 가장 붐비는/한가한 시간 (같으면 이른 시간, 데이터가 없으면 -1)
+    - busiest_people / calmest_people / average: (카페 수, 7) 해당 시간의 혼잡도, 요일 평균
+    - max_people: 카페별 최대 혼잡도
+    """
+    table = load_congestion_table()
+    weekday_pos = pd.Index(weekday_order).get_indexer(table['weekday'])
+    hours = table['hour'].to_numpy()
+    values = table['predicted_people'].to_numpy(dtype=float)
+    valid = (weekday_pos >= 0) & (hours >= 0) & (hours < CONGESTION_HOURS) & ~np.isnan(values)
+
+    store_codes, store_ids = pd.factorize(table['store_id'].to_numpy()[valid], sort=True)
+    people = np.full((len(store_ids), len(weekday_order), CONGESTION_HOURS), np.nan)
+    people[store_codes, weekday_pos[valid], hours[valid]] = values[valid]
+
+    observed_hours = ~np.isnan(people)
+    observed = observed_hours.any(axis=2)
+    busiest_hour = np.where(observed_hours, people, -np.inf).argmax(axis=2)
+    calmest_hour = np.where(observed_hours, people, np.inf).argmin(axis=2)
+    hour_counts = observed_hours.sum(axis=2)
+    average = np.divide(
+        np.where(observed_hours, people, 0.0).sum(axis=2), hour_counts,
+        out=np.full(observed.shape, np.nan), where=hour_counts > 0,
+    )
+
+    # 원본이 정수 컬럼이면 시간대별 혼잡도도 정수로 반환
+    people_dtype = table['predicted_people'].dtype if pd.api.types.is_integer_dtype(table['predicted_people']) else float
+
+    return {
+        'store_ids': pd.Index(store_ids),
+        'people': people,
+        'people_dtype': people_dtype,
+        'observed': observed,
+        'busiest_hour': np.where(observed, busiest_hour, -1),
+        'calmest_hour': np.where(observed, calmest_hour, -1),
+        'busiest_people': np.take_along_axis(people, busiest_hour[..., None], axis=2)[..., 0],
+        'calmest_people': np.take_along_axis(people, calmest_hour[..., None], axis=2)[..., 0],
+        'average': average,
+        'max_people': np.where(observed_hours, people, -np.inf).max(axis=(1, 2)),
+    }
+
+
+def get_congestion_index():
+    """
+    현재 데이터 버전의 혼잡도 집계 인덱스 반환 (파일이 바뀐 경우에만 다시 생성)
+    """
+    version = tuple((path, dataset_signature(path)) for path in congestion_source_paths())
+    with _congestion_index_lock:
+        if _congestion_index['version'] != version:
+            with span('aggregate'):
+                _congestion_index['data'] = build_congestion_index()
+            _congestion_index['version'] = version
+        return _congestion_index['data']
+
+
+def congestion_store_position(index, store_id):
+    """
+    혼잡도 배열에서 카페의 위치 (데이터가 없으면 LookupError)
+    """
+    position = index['store_ids'].get_indexer([store_id])[0]
+    if position < 0:
+        raise LookupError(f"{store_id}번 카페의 혼잡도 데이터가 없습니다.")
+    return position
+
+
+def calmest_windows(people, hours):
+    """
+    연속 hours시간 평균 혼잡도가 가장 낮은 구간 (마지막 축이 시간, 데이터가 없는 시간이 낀 구간은 제외)
+    반환값: (시작 시각 배열, 구간 평균 배열), 가능한 구간이 없으면 시작 시각 -1, 평균 NaN
+    """
+    observed = ~np.isnan(people)
+    pad = [(0, 0)] * (people.ndim - 1) + [(1, 0)]
+    sums = np.pad(np.cumsum(np.where(observed, people, 0.0), axis=-1), pad)
+    counts = np.pad(np.cumsum(observed, axis=-1), pad)
+
+    window_sums = sums[..., hours:] - sums[..., :-hours]
+    complete = (counts[..., hours:] - counts[..., :-hours]) == hours
+    candidates = np.where(complete, window_sums, np.inf)
+
+    start = candidates.argmin(axis=-1)
+    best = np.take_along_axis(candidates, start[..., None], axis=-1)[..., 0]
+    found = np.isfinite(best)
+    return np.where(found, start, -1), np.where(found, best / hours, np.nan)
+
+
+def congestion_summary_data(store_id=TARGET_STORE_ID):
+    """
+    카페의 요일별 가장 붐비는 시간대, 가장 한가한 시간대, 평균 혼잡도 조회
+    """
+    index = get_congestion_index()
+    position = congestion_store_position(index, store_id)
+    observed = index['observed'][position]
+    people_dtype = index['people_dtype']
+
+    # 데이터가 있는 요일만 (weekday_order 순)
+    weekday_labels = pd.Categorical(
+        np.array(weekday_korean)[observed], categories=weekday_korean, ordered=True
+    )
+
+    # 요일별로 가장 붐비는 시간 / 가장 한가한 시간
+    busiest_times = pd.DataFrame({
+        'weekday_korean': weekday_labels,
+        'hour': index['busiest_hour'][position][observed],
+        'predicted_people': index['busiest_people'][position][observed].astype(people_dtype),
+    })
+    least_busy_times = pd.DataFrame({
+        'weekday_korean': weekday_labels,
+        'hour': index['calmest_hour'][position][observed],
+        'predicted_people': index['calmest_people'][position][observed].astype(people_dtype),
+    })
+
+    # 요일별 평균 혼잡도
+    average_congestion = pd.DataFrame({
+        'weekday_korean': weekday_labels,
+        'predicted_people': index['average'][position][observed],
+    })
+
+    return {
+        'busiest_times': busiest_times,
+        'least_busy_times': least_busy_times,
+        'average_congestion': average_congestion,
+        'max_people': np.array(index['max_people'][position]).astype(people_dtype)[()],
+    }
+
+
+def congestion_statistics(store_id, percentiles=CONGESTION_PERCENTILES, window_hours=CONGESTION_WINDOW_HOURS):
+    """
+    카페의 요일별, 주간 전체 혼잡도 통계 (차트 없이 숫자만, JSON 응답용)
+    busiest / calmest / mean / percentiles / calmestWindow(연속 window_hours시간 평균이 가장 낮은 구간)
+    """
+    index = get_congestion_index()
+    position = congestion_store_position(index, store_id)
+    people = index['people'][position]
+    observed = index['observed'][position]
+    people_dtype = index['people_dtype']
+
+    def number(value, integral=False):
+        if np.isnan(value):
+            return None
+        return int(value) if integral and people_dtype != float else round(float(value), 3)
+
+    def percentile_map(values):
+        return {str(q): number(v) for q, v in zip(percentiles, values)}
+
+    window_start, window_mean = calmest_windows(people, window_hours)
+    weekday_percentiles = np.full((len(weekday_order), len(percentiles)), np.nan)
+    if percentiles and observed.any():
+        weekday_percentiles[observed] = np.nanpercentile(people[observed], percentiles, axis=1).T
+
+    weekdays = []
+    for day in np.flatnonzero(observed):
+        weekdays.append({
+            "weekday": weekday_order[day],
+            "label": weekday_korean[day],
+            "busiest": {
+                "hour": int(index['busiest_hour'][position][day]),
+                "people": number(index['busiest_people'][position][day], integral=True),
+            },
+            "calmest": {
+                "hour": int(index['calmest_hour'][position][day]),
+                "people": number(index['calmest_people'][position][day], integral=True),
+            },
+            "mean": number(index['average'][position][day]),
+            "percentiles": percentile_map(weekday_percentiles[day]),
+            "calmestWindow": None if window_start[day] < 0 else {
+                "start": int(window_start[day]),
+                "end": int(window_start[day]) + window_hours,
+                "mean": number(window_mean[day]),
+            },
+        })
+
+    # 주간 전체: (요일, 시간) 평면에서의 최대/최소
+    filled = np.where(np.isnan(people), -np.inf, people)
+    busiest_day, busiest_hour = np.unravel_index(filled.argmax(), people.shape)
+    filled = np.where(np.isnan(people), np.inf, people)
+    calmest_day, calmest_hour = np.unravel_index(filled.argmin(), people.shape)
+    values = people[~np.isnan(people)]
+
+    return {
+        "storeId": int(store_id),
+        "windowHours": window_hours,
+        "weekdays": weekdays,
+        "overall": {
+            "busiest": {
+                "weekday": weekday_order[busiest_day], "hour": int(busiest_hour),
+                "people": number(people[busiest_day, busiest_hour], integral=True),
+            },
+            "calmest": {
+                "weekday": weekday_order[calmest_day], "hour": int(calmest_hour),
+                "people": number(people[calmest_day, calmest_hour], integral=True),
+            },
+            "mean": number(values.mean()),
+            "percentiles": percentile_map(np.percentile(values, percentiles) if percentiles else []),
+        },
+    }
+
+
+def draw_busiest_and_least_busy(summary, output_path):
+    """
+    요일별 가장 붐비는 시간대와 가장 한가한 시간대 그래프 저장
+    """
+    busiest_times = summary['busiest_times']
+    least_busy_times = summary['least_busy_times']
+
+    fig = chart_figure(figsize=(8, 7))
+    ax = fig.subplots()
+
+    # 가장 붐비는 시간대
+    ax.bar(busiest_times['weekday_korean'], busiest_times['predicted_people'], color='lightcoral', label='Busiest Time')
+    for weekday, people, hour in zip(
+        busiest_times['weekday_korean'], busiest_times['predicted_people'], busiest_times['hour']
+    ):
+        ax.text(
+            weekday,
+            people + 0.5,  # 텍스트를 막대 위로 배치
+            f"{int(hour)}o'clock",
+            ha='center',
+            va='bottom',
+            fontsize=14
+        )
+
+    # 가장 한가한 시간대
+    ax.bar(least_busy_times['weekday_korean'], least_busy_times['predicted_people'], color='skyblue', label='Calmest Time')
+    for weekday, people, hour in zip(
+        least_busy_times['weekday_korean'], least_busy_times['predicted_people'], least_busy_times['hour']
+    ):
+        ax.text(
+            weekday,
+            people + 0.2,  # 텍스트를 막대 위로 배치
+            f"{int(hour)}o'clock",
+            ha='center',
+            va='bottom',
+            fontsize=14,
+            color='black',
+            bbox=dict(facecolor='none', edgecolor='none', alpha=0.7)  # 텍스트 배경 추가
+        )
+    ax.set_title('Busiest and Calmest Time Periods by Day of the Week', fontsize=18)
+    ax.tick_params(axis='x', labelsize=18)
+    ax.set_xlabel('Week', fontsize=16)
+    ax.set_ylabel('Congestion', fontsize=16)
+    ax.set_ylim(0, summary['max_people'] + 2) 
+    ax.legend(fontsize=14)
+    save_figure(fig, output_path, tight_layout=True)
+
+
+def draw_average_congestion(summary, output_path):
+    """
+    요일별 평균 혼잡도 그래프 저장
+    """
+    average_congestion = summary['average_congestion']
+
+    fig = chart_figure(figsize=(7, 5))
+    ax = fig.subplots()
+    ax.bar(average_congestion['weekday_korean'], average_congestion['predicted_people'], color='#2E8465', label='average_congestion')
+    ax.set_title('Average Congestion by Day of the Week', fontsize=18)
+    ax.tick_params(axis='x', labelsize=16)
+    ax.set_xlabel('Week', fontsize=16)
+    ax.set_ylabel('Congestion', fontsize=16)
+    ax.set_ylim(0, summary['max_people'] + 2) 
+    ax.legend(fontsize=16)
+    save_figure(fig, output_path, tight_layout=True)
+
+
+def generate_busiest_and_least_busy_times(store_id=TARGET_STORE_ID):
+    """
+    요일별 가장 붐비는 시간대, 가장 한가한 시간대, 평균 혼잡도 시각화
+    """
+    summary = congestion_summary_data(store_id)
+
+    # 그래프 1: 가장 붐비는 시간대와 가장 한가한 시간대
+    busiest_and_least_busy_path = os.path.join(STATIC_FOLDER, 'busiest_and_least_busy.png')
+    draw_busiest_and_least_busy(summary, busiest_and_least_busy_path)
+
+    # 그래프 2: 평균 혼잡도
+    average_congestion_path = os.path.join(STATIC_FOLDER, 'average_congestion.png')
+    draw_average_congestion(summary, average_congestion_path)
+
+    return busiest_and_least_busy_path, average_congestion_path
+
+
+# 실시간 점유 상태: store(통합).csv의 실시간 컬럼을 카페 행 위치별 배열로 메모리에 두고 요청마다 O(1)로 갱신
+# 디스크에는 주기적으로 스냅샷만 저장 (CSV는 건드리지 않음), 워커 간에는 스냅샷을 통해 updated_at이 최신인 값으로 맞춤
+OCCUPANCY_COUNT_COLUMNS = [
+    'current_customer_count', 'max_customer_count', 'store_congestion_level', 'store_congestion_value',
+    'user_congestion_level', 'user_congestion_value',
+]
+OCCUPANCY_TIME_COLUMNS = ['user_congestion_input_time', 'updated_at']
+OCCUPANCY_SNAPSHOT_PATH = os.getenv("OCCUPANCY_SNAPSHOT_PATH", os.path.join(DATA_DIR, 'occupancy_snapshot.csv'))
+OCCUPANCY_SNAPSHOT_INTERVAL = float(os.getenv("OCCUPANCY_SNAPSHOT_INTERVAL", "30"))  # 초
+OCCUPANCY_BATCH_MAX = 1000
+# 혼잡도 값(0~100) -> 단계 (0: 여유, 1: 보통, 2: 혼잡), 경계 값 이하이면 해당 단계
+CONGESTION_LEVEL_BOUNDS = [33, 66]
+
+_occupancy = {'version': None, 'data': None, 'dirty': False, 'snapshot_signature': None}
+_occupancy_lock = threading.Lock()
+_occupancy_snapshot_lock = threading.Lock()
+_occupancy_threads = []
+
+
+def congestion_levels(values):
+    """
+    혼잡도 값 배열을 단계로 변환 (값이 없으면 NaN)
+    """
+    values = np.asarray(values, dtype=float)
+    return np.where(np.isnan(values), np.nan, np.searchsorted(CONGESTION_LEVEL_BOUNDS, values, side='left'))
+
+
+def merge_occupancy_rows(data, store_ids, counts, times):
+    """
+    다른 상태(이전 인덱스, 스냅샷)의 행 중 updated_at이 더 최신인 행으로 덮어씀 (반환값: 바뀐 행 수)
+    """
+    positions = data['store_ids'].get_indexer(store_ids)
+    found = positions >= 0
+    positions, counts, times = positions[found], counts[found], times[found]
+    current = data['times'][positions, 1]
+    newer = ~np.isnat(times[:, 1]) & (np.isnat(current) | (times[:, 1] > current))
+    data['counts'][positions[newer]] = counts[newer]
+    data['times'][positions[newer]] = times[newer]
+    return int(newer.sum())
+
+
+def read_occupancy_snapshot():
+    """
+    스냅샷 파일을 (카페 id, 개수 배열, 시각 배열)로 읽음 (파일이 없으면 None)
+    """
+    if not os.path.exists(OCCUPANCY_SNAPSHOT_PATH):
+        return None
+    snapshot = pd.read_csv(OCCUPANCY_SNAPSHOT_PATH, parse_dates=OCCUPANCY_TIME_COLUMNS)
+    return (
+        snapshot['id'].to_numpy(),
+        snapshot[OCCUPANCY_COUNT_COLUMNS].to_numpy(dtype=float),
+        snapshot[OCCUPANCY_TIME_COLUMNS].to_numpy(dtype='datetime64[ns]'),
+    )
+
+
+def build_occupancy_state():
+    """
+    실시간 점유 상태 생성 (카페 CSV의 실시간 컬럼 + 스냅샷 중 최신 값)
+    - store_ids: 카페 id -> 행 위치 해시 인덱스
+    - counts: (카페 수, 6) OCCUPANCY_COUNT_COLUMNS 값 (없으면 NaN)
+    - times: (카페 수, 2) OCCUPANCY_TIME_COLUMNS 시각 (없으면 NaT)
+    """
+    # 상태 테이블이 값을 직접 들고 있으므로 데이터셋 캐시에는 올리지 않음
+    columns = ['id', *OCCUPANCY_COUNT_COLUMNS, *OCCUPANCY_TIME_COLUMNS]
+    store_info = read_dataset(store_info_path, dataset_signature(store_info_path), columns)
+    data = {
+        'store_ids': pd.Index(store_info['id']),
+        'counts': store_info[OCCUPANCY_COUNT_COLUMNS].to_numpy(dtype=float),
+        'times': store_info[OCCUPANCY_TIME_COLUMNS].to_numpy(dtype='datetime64[ns]'),
+    }
+    snapshot = read_occupancy_snapshot()
+    if snapshot is not None:
+        merge_occupancy_rows(data, *snapshot)
+    return data
+
+
+def get_occupancy_state():
+    """
+    현재 점유 상태 반환 (_occupancy_lock 안에서 호출)
+    카페 CSV가 바뀌면 다시 만들고, 그동안 메모리에서 갱신한 값은 updated_at 기준으로 유지
+    """
+    version = dataset_signature(store_info_path)
+    if _occupancy['version'] != version:
+        previous = _occupancy['data']
+        with span('occupancy'):
+            data = build_occupancy_state()
+            if previous is not None:
+                merge_occupancy_rows(data, previous['store_ids'].to_numpy(), previous['counts'], previous['times'])
+        _occupancy['data'] = data
+        _occupancy['version'] = version
+    return _occupancy['data']
+
+
+def occupancy_entries(store_ids):
+    """
+    여러 카페의 현재 점유 상태 (점유율은 현재 인원 / 최대 인원)
+    반환값: ({store_id: 상태}, {store_id: 오류 메시지})
+    """
+    with _occupancy_lock:
+        data = get_occupancy_state()
+        positions = data['store_ids'].get_indexer(store_ids)
+        found = positions >= 0
+        counts = data['counts'][positions[found]]
+        times = data['times'][positions[found]]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = np.where(counts[:, 1] > 0, counts[:, 0] / counts[:, 1], np.nan)
+
+    def number(value):
+        return None if np.isnan(value) else int(value)
+
+    def timestamp(value):
+        return None if np.isnat(value) else pd.Timestamp(value).isoformat()
+
+    entries = {}
+    for store_id, row, ratio, (input_time, updated_at) in zip(np.asarray(store_ids)[found], counts, ratios, times):
+        entries[int(store_id)] = {
+            "currentCustomerCount": number(row[0]),
+            "maxCustomerCount": number(row[1]),
+            "occupancyRatio": None if np.isnan(ratio) else round(float(ratio), 3),
+            "congestionLevel": number(row[2]),
+            "congestionValue": number(row[3]),
+            "userCongestionLevel": number(row[4]),
+            "userCongestionValue": number(row[5]),
+            "userCongestionInputTime": timestamp(input_time),
+            "updatedAt": timestamp(updated_at),
+        }
+    errors = {store_id: STORE_NOT_FOUND_MESSAGE for store_id, ok in zip(store_ids, found) if not ok}
+    return entries, errors
+
+
+def update_occupancy(store_id, current=None, maximum=None, store_value=None, user_value=None):
+    """
+    카페 한 곳의 점유 상태 갱신 (카페가 없으면 LookupError)
+    store_value 없이 인원이 바뀌면 혼잡도 값은 현재 인원 / 최대 인원(%)으로 계산, 단계는 값에서 계산
+    """
+    now = np.datetime64(pd.Timestamp.now().to_datetime64(), 'ns')
+    with _occupancy_lock:
+        data = get_occupancy_state()
+        position = data['store_ids'].get_indexer([store_id])[0]
+        if position < 0:
+            raise LookupError(STORE_NOT_FOUND_MESSAGE)
+        row = data['counts'][position]
+
+        if current is not None:
+            row[0] = current
+        if maximum is not None:
+            row[1] = maximum
+        if store_value is None and (current is not None or maximum is not None) and row[1] > 0:
+            store_value = round(100 * min(row[0] / row[1], 1.0))
+        if store_value is not None:
+            row[2], row[3] = congestion_levels([store_value])[0], store_value
+        if user_value is not None:
+            row[4], row[5] = congestion_levels([user_value])[0], user_value
+            data['times'][position, 0] = now
+            # 사용자 입력은 예측 보정에 쓰이므로 예측 테이블을 바로 다시 계산
+            _forecast_wakeup.set()
+        data['times'][position, 1] = now
+
+        _occupancy['dirty'] = True
+    start_occupancy_snapshot_thread()
+    increment_counter('occupancy_update')
+
+
+def snapshot_occupancy():
+    """
+    점유 상태를 스냅샷 파일에 저장 (다른 워커가 저장한 스냅샷의 최신 행은 먼저 가져옴)
+    바뀐 것이 없으면 아무것도 하지 않음
+    """
+    with _occupancy_lock:
+        if _occupancy['data'] is None:
+            return
+        signature = dataset_signature(OCCUPANCY_SNAPSHOT_PATH) if os.path.exists(OCCUPANCY_SNAPSHOT_PATH) else None
+        external = signature is not None and signature != _occupancy['snapshot_signature']
+        if not (_occupancy['dirty'] or external):
+            return
+        data = _occupancy['data']
+        if external:
+            merge_occupancy_rows(data, *read_occupancy_snapshot())
+        snapshot = pd.DataFrame(data['counts'], columns=OCCUPANCY_COUNT_COLUMNS).astype('Int32')
+        snapshot.insert(0, 'id', data['store_ids'].to_numpy())
+        for column, values in zip(OCCUPANCY_TIME_COLUMNS, data['times'].T):
+            snapshot[column] = values
+        _occupancy['dirty'] = False
+
+    # 파일 쓰기는 상태 잠금 밖에서 (임시 파일에 쓴 뒤 교체)
+    with _occupancy_snapshot_lock, span('occupancy_snapshot'):
+        temporary = f"{OCCUPANCY_SNAPSHOT_PATH}.{os.getpid()}.tmp"
+        snapshot.to_csv(temporary, index=False)
+        os.replace(temporary, OCCUPANCY_SNAPSHOT_PATH)
+        signature = dataset_signature(OCCUPANCY_SNAPSHOT_PATH)
+    with _occupancy_lock:
+        _occupancy['snapshot_signature'] = signature
+
+
+def occupancy_snapshot_worker():
+    """
+    OCCUPANCY_SNAPSHOT_INTERVAL마다 점유 상태 스냅샷 저장
+    """
+    while True:
+        time.sleep(OCCUPANCY_SNAPSHOT_INTERVAL)
+        try:
+            snapshot_occupancy()
+        except Exception as e:
+            print(f"점유 상태 스냅샷 오류: {e}")
+
+
+def start_occupancy_snapshot_thread():
+    """
+    스냅샷 스레드를 처음 갱신될 때 띄움 (종료 시에도 한 번 저장)
+    """
+    with _occupancy_lock:
+        if _occupancy_threads:
+            return
+        thread = threading.Thread(target=occupancy_snapshot_worker, name='occupancy-snapshot', daemon=True)
+        thread.start()
+        _occupancy_threads.append(thread)
+    atexit.register(snapshot_occupancy)
+
+
+# 혼잡도 예측: 요일별 예측 혼잡도(주간 프로필)를 사용자 혼잡도 입력으로 보정한 시간별 조회 테이블
+# 보정값은 (입력값 - 입력 시각의 프로필 혼잡도)의 지수 평활, 입력 후 한 시간마다 FORECAST_DECAY 비율로 줄어듦
+# 테이블은 백그라운드 스레드가 FORECAST_INTERVAL마다 (사용자 입력이 들어오면 바로) 다시 계산하고 요청은 조회만 함
+FORECAST_HOURS = 24
+# 테이블은 FORECAST_HOURS보다 하루 길게 계산 (다음 계산 전에 시각이 넘어가도 같은 테이블에서 잘라 씀)
+FORECAST_TABLE_HOURS = FORECAST_HOURS + 24
+FORECAST_ALPHA = float(os.getenv("FORECAST_ALPHA", "0.5"))
+FORECAST_DECAY = float(os.getenv("FORECAST_DECAY", "0.7"))
+FORECAST_INTERVAL = float(os.getenv("FORECAST_INTERVAL", "300"))  # 초
+
+_forecast = {'data': None, 'smoothing': None}
+_forecast_lock = threading.Lock()
+_forecast_wakeup = threading.Event()
+_forecast_threads = []
+
+
+def weekday_hour_positions(times):
+    """
+    시각 배열의 (weekday_order 위치, 시간) 배열
+    """
+    times = pd.DatetimeIndex(times)
+    return (times.dayofweek.to_numpy() + 1) % len(weekday_order), times.hour.to_numpy()
+
+
+def hours_between(start, end):
+    """
+    두 시각 배열 사이의 시간(시간 단위 실수, 둘 중 하나가 없으면 NaN)
+    """
+    elapsed = (end - start).astype('timedelta64[s]').astype(float) / 3600
+    return np.where(np.isnat(start) | np.isnat(end), np.nan, elapsed)
+
+
+def smooth_congestion_bias(smoothing, profile, observed, input_times):
+    """
+    카페별 보정값을 새 사용자 입력으로 지수 평활 갱신 (배열 연산, 이미 반영한 입력은 건너뜀)
+    bias = (1 - alpha) * 이전 bias * decay^(경과 시간) + alpha * (입력값 - 입력 시각의 프로필)
+    입력 시각에 프로필이 없으면 같은 요일에서 가장 가까운 프로필 시간을 사용 (그 요일에 프로필이 없으면 건너뜀)
+    """
+    bias, bias_time = smoothing['bias'], smoothing['time']
+    new = ~np.isnat(input_times) & ~np.isnan(observed) & (np.isnat(bias_time) | (input_times > bias_time))
+    stores = np.flatnonzero(new)
+    weekdays, hours = weekday_hour_positions(input_times[stores])
+    day_profiles = profile[stores, weekdays]
+    distance = np.abs(np.arange(day_profiles.shape[1]) - hours[:, None]).astype(float)
+    distance[np.isnan(day_profiles)] = np.inf
+    nearest = distance.argmin(axis=1)
+    expected = day_profiles[np.arange(len(stores)), nearest]
+    known = ~np.isnan(expected)
+    stores, expected = stores[known], expected[known]
+
+    previous = np.nan_to_num(bias[stores] * FORECAST_DECAY ** hours_between(bias_time[stores], input_times[stores]))
+    bias[stores] = (1 - FORECAST_ALPHA) * previous + FORECAST_ALPHA * (observed[stores] - expected)
+    bias_time[stores] = input_times[stores]
+    return len(stores)
+
+
+def build_forecast(index, counts, times, smoothing, start):
+    """
+    카페 x 앞으로 FORECAST_TABLE_HOURS시간의 예측 테이블 생성
+    - congestion: 예측 혼잡도(%) = 프로필(예측 인원 / 최대 인원) + 보정값 * decay^(입력 후 경과 시간), 0~100
+    - people / levels: 예측 인원, 혼잡도 단계 (프로필이 없는 시간은 NaN)
+    - next_calm: 각 시각부터 처음으로 여유(단계 0)인 시각의 위치 (없으면 FORECAST_TABLE_HOURS)
+    """
+    # 최대 인원이 없는 카페는 프로필의 최대 인원을 기준으로 (둘 다 없으면 NaN, 예측도 NaN)
+    capacity = np.where(counts[:, 1] > 0, counts[:, 1], index['max_people'])
+    capacity = np.where(capacity > 0, capacity, np.nan)
+    profile = index['people'] / capacity[:, None, None] * 100
+    updated = smooth_congestion_bias(smoothing, profile, counts[:, 5], times[:, 0])
+
+    slots = start + pd.to_timedelta(np.arange(FORECAST_TABLE_HOURS), unit='h')
+    weekdays, hours = weekday_hour_positions(slots)
+    elapsed = np.maximum(hours_between(smoothing['time'][:, None], slots.to_numpy()[None, :]), 0)
+    adjustment = np.nan_to_num(smoothing['bias'][:, None] * FORECAST_DECAY ** elapsed)
+    congestion = np.clip(profile[:, weekdays, hours] + adjustment, 0, 100)
+
+    levels = congestion_levels(congestion)
+    positions = np.where(levels == 0, np.arange(FORECAST_TABLE_HOURS), FORECAST_TABLE_HOURS)
+    next_calm = np.minimum.accumulate(positions[:, ::-1], axis=1)[:, ::-1]
+
+    return {
+        'store_ids': index['store_ids'],
+        'start': start,
+        'slots': slots,
+        'capacity': capacity,
+        'bias': smoothing['bias'].copy(),
+        'congestion': congestion.astype(np.float32),
+        'people': (congestion * capacity[:, None] / 100).astype(np.float32),
+        'levels': levels,
+        'next_calm': next_calm.astype(np.int16),
+        'computed_at': pd.Timestamp.now(),
+        'updated_stores': updated,
+    }
+
+
+def refresh_forecast():
+    """
+    현재 시각(정시)부터의 예측 테이블을 다시 계산 (지수 평활 상태는 카페 id 기준으로 이어감)
+    """
+    index = get_congestion_index()
+    store_ids = index['store_ids']
+    with _occupancy_lock:
+        data = get_occupancy_state()
+        positions = data['store_ids'].get_indexer(store_ids)
+        counts = np.where((positions >= 0)[:, None], data['counts'][positions], np.nan)
+        times = np.where((positions >= 0)[:, None], data['times'][positions], np.datetime64('NaT'))
+
+    with _forecast_lock, span('forecast'):
+        smoothing = _forecast['smoothing']
+        if smoothing is None or not smoothing['store_ids'].equals(store_ids):
+            previous = smoothing
+            smoothing = {
+                'store_ids': store_ids,
+                'bias': np.zeros(len(store_ids)),
+                'time': np.full(len(store_ids), np.datetime64('NaT'), dtype='datetime64[ns]'),
+            }
+            if previous is not None:
+                kept = previous['store_ids'].get_indexer(store_ids)
+                smoothing['bias'][kept >= 0] = previous['bias'][kept[kept >= 0]]
+                smoothing['time'][kept >= 0] = previous['time'][kept[kept >= 0]]
+        _forecast['data'] = build_forecast(index, counts, times, smoothing, pd.Timestamp.now().floor('h'))
+        _forecast['smoothing'] = smoothing
+    increment_counter('forecast_refresh')
+    return _forecast['data']
+
+
+def forecast_worker():
+    """
+    FORECAST_INTERVAL마다, 또는 사용자 혼잡도 입력이 들어오면 예측 테이블 재계산
+    """
+    while True:
+        _forecast_wakeup.wait(FORECAST_INTERVAL)
+        _forecast_wakeup.clear()
+        try:
+            refresh_forecast()
+        except Exception as e:
+            print(f"혼잡도 예측 계산 오류: {e}")
+
+
+def start_forecast_thread():
+    """
+    예측 스레드를 처음 필요할 때 띄움
+    """
+    with _forecast_lock:
+        if _forecast_threads:
+            return
+        thread = threading.Thread(target=forecast_worker, name='forecast', daemon=True)
+        thread.start()
+        _forecast_threads.append(thread)
+
+
+def get_forecast():
+    """
+    현재 예측 테이블과 현재 시각의 위치 반환
+    테이블이 없거나 FORECAST_HOURS 이후가 모자랄 만큼 오래됐을 때만 요청 안에서 계산
+    """
+    start_forecast_thread()
+    data = _forecast['data']
+    now = pd.Timestamp.now().floor('h')
+    offset = None if data is None else int((now - data['start']) / pd.Timedelta(hours=1))
+    if offset is None or not 0 <= offset <= FORECAST_TABLE_HOURS - FORECAST_HOURS:
+        data, offset = refresh_forecast(), 0
+    elif offset > 0:
+        _forecast_wakeup.set()
+    return data, offset
+
+
+def store_forecast(store_id, hours=FORECAST_HOURS):
+    """
+    카페의 앞으로 hours시간 예측 혼잡도와 다음 여유 시간 (JSON 응답용, 혼잡도 데이터가 없으면 LookupError)
+    """
+    data, offset = get_forecast()
+    position = data['store_ids'].get_indexer([store_id])[0]
+    if position < 0:
+        raise LookupError(f"{store_id}번 카페의 혼잡도 데이터가 없습니다.")
+
+    def slot(k):
+        congestion = data['congestion'][position, k]
+        known = not np.isnan(congestion)
+        return {
+            "time": data['slots'][k].isoformat(),
+            "weekday": weekday_order[(data['slots'][k].dayofweek + 1) % len(weekday_order)],
+            "hour": int(data['slots'][k].hour),
+            "expectedPeople": round(float(data['people'][position, k]), 1) if known else None,
+            "congestionValue": round(float(congestion), 1) if known else None,
+            "congestionLevel": int(data['levels'][position, k]) if known else None,
+        }
+
+    next_calm = int(data['next_calm'][position, offset])
+    return {
+        "storeId": int(store_id),
+        "generatedAt": data['computed_at'].isoformat(),
+        "capacity": None if np.isnan(data['capacity'][position]) else int(data['capacity'][position]),
+        "adjustment": round(float(data['bias'][position]), 1),
+        "hours": [slot(k) for k in range(offset, offset + hours)],
+        "nextCalmSlot": slot(next_calm) if next_calm < offset + hours else None,
+    }
+
+
+STORE_NOT_FOUND_MESSAGE = "해당 ID의 카페가 store(통합).csv에 존재하지 않습니다."
+NO_FAVORITE_USERS_MESSAGE = "해당 카페를 좋아요했거나 설문조사에 응답한 사용자가 없습니다."
+
+
+def store_distribution_tables(store_ids):
+    """
+    여러 카페를 좋아요한 사용자(카페별 중복 제거)의 성별, 연령대, 선호 메뉴 분포를 한 번에 계산
+    반환값: (gender, age_group, favorite_menu 분포 DataFrame (index: store_id), 카페별 응답자 수, {store_id: 오류 메시지})
+    """
+    index = get_id_index()
+    store_ids = list(dict.fromkeys(store_ids))
+    store_pos = index['store_ids'].get_indexer(store_ids)
+    errors = {store_id: STORE_NOT_FOUND_MESSAGE for store_id, pos in zip(store_ids, store_pos) if pos < 0}
+
+    # 요청한 카페들의 즐겨찾기 행 (카페별 CSR 구간과 추가된 행만 모음)
+    found = store_pos[store_pos >= 0]
+    rows = (
+        np.concatenate([store_favorite_rows(index, pos) for pos in found])
+        if len(found) else np.array([], dtype=np.int64)
+    )
+
+    # (카페, 설문 행) 쌍: 설문이 있는 사용자만, 같은 카페를 여러 번 좋아요한 사용자는 한 번
+    pairs = np.stack([index['favorite_store_pos'][rows], index['favorite_user_pos'][rows]], axis=1)
+    pairs = np.unique(pairs[pairs[:, 1] >= 0], axis=0)
+
+    # 요청 순서의 카페 번호별 인원표 (bincount)
+    found = pd.Index(found)
+    groups = found.get_indexer(pairs[:, 0])
+    crosstabs = demographic_crosstabs(index['demographics'], groups, pairs[:, 1], len(found))
+    found_ids = pd.Index(index['store_ids'].to_numpy()[found], name='store_id')
+    tables = []
+    for column in DEMOGRAPHIC_COLUMNS:
+        categories = index['demographics'][column][1]
+        order = category_order(column, categories)
+        tables.append(pd.DataFrame(crosstabs[column][:, order], index=found_ids, columns=categories[order]))
+    respondents = pd.Series(np.bincount(groups, minlength=len(found)), index=found_ids, name='respondents')
+
+    for store_id, count in respondents.items():
+        if count == 0:
+            errors[store_id] = NO_FAVORITE_USERS_MESSAGE
+    return (*tables, respondents, errors)
+
+
+def store_distributions(store_ids):
+    """
+    여러 카페의 성별, 연령대, 선호 메뉴 분포 Series
+    반환값: ({store_id: (gender_counts, age_counts, favorite_menu_counts)}, {store_id: 오류 메시지})
+    """
+    gender_table, age_table, menu_table, _, errors = store_distribution_tables(store_ids)
+
+    def counts(table, store_id, name, keep_zero=False):
+        row = table.loc[store_id] if store_id in table.index else pd.Series(0, index=table.columns)
+        row = row.rename('count').rename_axis(name).astype('int64')
+        if keep_zero:
+            return row
+        return row[row > 0].sort_values(ascending=False, kind='stable')
+
+    distributions = {
+        store_id: (
+            counts(gender_table, store_id, 'gender'),
+            counts(age_table, store_id, 'age_group', keep_zero=True),
+            counts(menu_table, store_id, 'favorite_menu'),
+        )
+        for store_id in dict.fromkeys(store_ids)
+        if store_id not in errors
+    }
+    return distributions, errors
+
+
+def target_store_distributions(target_id):
+    """
+    특정 카페를 좋아요한 사용자의 성별, 연령대, 선호 메뉴 분포 계산
+    """
+    distributions, errors = store_distributions([target_id])
+    if target_id in errors:
+        raise ValueError(errors[target_id])
+    return distributions[target_id]
+
+
+def store_profile(store_id):
+    """
+    카페를 좋아요한 사용자의 인구통계 프로필 (JSON 응답용, 차트와 같은 분포 사용)
+    항목별 값, 인원, 비율 (비율은 해당 항목에 응답한 인원 기준), 카페가 없으면 LookupError
+    segments: (gender, age_group, favorite_menu) 조합별 즐겨찾기 수 (세 항목에 모두 응답한 즐겨찾기만, 많은 순)
+    """
+    gender_table, age_table, menu_table, respondents, errors = store_distribution_tables([store_id])
+    if errors.get(store_id) == STORE_NOT_FOUND_MESSAGE:
+        raise LookupError(STORE_NOT_FOUND_MESSAGE)
+
+    demographics = favorites_demographics()
+    try:
+        segments = demographics.xs(store_id, level='store_id')
+    except KeyError:
+        segments = demographics.iloc[0:0].droplevel('store_id')
+    segments = segments.sort_values(ascending=False, kind='stable')
+
+    def entries(table, keep_zero=False):
+        row = table.loc[store_id]
+        if not keep_zero:
+            row = row[row > 0].sort_values(ascending=False, kind='stable')
+        total = row.sum()
+        return [
+            {"value": value, "count": int(count), "share": round(float(count / total), 3) if total else 0.0}
+            for value, count in row.items()
+        ]
+
+    return {
+        "storeId": int(store_id),
+        "respondents": int(respondents.loc[store_id]),
+        "gender": entries(gender_table),
+        "ageGroup": entries(age_table, keep_zero=True),
+        "favoriteMenu": entries(menu_table),
+        "segments": [
+            {"gender": gender, "ageGroup": age_group, "favoriteMenu": menu, "count": int(count)}
+            for (gender, age_group, menu), count in segments.items()
+        ],
+    }
+
+
+def draw_target_gender(gender_counts, output_path):
+    """
+    타겟 카페 성별 분포 그래프 저장
+    """
+    fig = chart_figure(figsize=DEFAULT_FIGSIZE)
+    ax = fig.subplots()
+    gender_counts.plot(kind='bar', color=['lightpink', 'skyblue'], rot=0, ax=ax)
+    ax.set_title('Gender Distribution', fontsize=14)  # 제목 폰트 크기 설정
+    ax.set_xlabel('Gender', fontsize=12)  # x축 폰트 크기 설정
+    ax.set_ylabel('Number of People', fontsize=12)  # y축 폰트 크기 설정
+    ax.set_xticks(
+        range(len(gender_counts)),
+        labels=[GENDER_LABELS.get(gender, gender) for gender in gender_counts.index],
+        fontsize=12,
+    )
+    save_figure(fig, output_path)
+
+
+def draw_target_age(age_counts, output_path):
+    """
+    타겟 카페 연령대 분포 그래프 저장
+    """
+    fig = chart_figure(figsize=DEFAULT_FIGSIZE)
+    ax = fig.subplots()
+    age_counts.plot(kind='bar', color='#e38a6d', rot=0, ax=ax)
+    ax.tick_params(axis='x', labelsize=12)
+    ax.set_title('Age Distribution', fontsize=14)  # 제목 폰트 크기 설정
+    ax.set_xlabel('Age', fontsize=12)  # x축 폰트 크기 설정
+    ax.set_ylabel('Number of People', fontsize=12)  # y축 폰트 크기 설정
+    save_figure(fig, output_path)
+
+
+def draw_target_menu(favorite_menu_counts, output_path):
+    """
+    타겟 카페 선호 메뉴 분포 그래프 저장
+    """
+    fig = chart_figure(figsize=DEFAULT_FIGSIZE)
+    ax = fig.subplots()
+    favorite_menu_counts.plot(kind='bar', color='#8a6857', rot=45, ax=ax)
+    ax.tick_params(axis='x', labelsize=12)
+    ax.set_title('Favorite Menu Distribution', fontsize=14)  # 제목 폰트 크기 설정
+    ax.set_xlabel('Preference', fontsize=12)  # x축 폰트 크기 설정
+    ax.set_ylabel('Number of People', fontsize=12)  # y축 폰트 크기 설정
+    save_figure(fig, output_path, bbox_inches='tight')
+
+
+STORE_IMAGE_CHARTS = (
+    ("genderImageUrl", 'gender_distribution_store', draw_target_gender),
+    ("ageImageUrl", 'age_distribution_store', draw_target_age),
+    ("menuImageUrl", 'favorite_menu_distribution_store', draw_target_menu),
+)
+
+
+def store_chart_jobs(store_ids):
+    """
+    카페별 성별, 연령대, 선호 메뉴 차트 렌더링 작업 (카페 id가 들어간 차트 이름으로 서로 덮어쓰지 않음)
+    반환값: ({(store_id, 결과 키): render_charts 작업}, {store_id: 데이터 오류})
+    """
+    distributions, errors = store_distributions(store_ids)
+    jobs = {}
+    for store_id, store_counts in distributions.items():
+        for (job_key, name, draw), data in zip(STORE_IMAGE_CHARTS, store_counts):
+            jobs[(store_id, job_key)] = (f'{name}_{store_id}', draw, data, {})
+    return jobs, errors
+
+
+def visualize_favorites_by_store(store_ids=(TARGET_STORE_ID,)):
+    """
+    카페를 좋아요한 사용자의 성별, 연령대, 선호 메뉴를 카페별로 시각화합니다.
+    반환값: {store_id: {결과 키: static 기준 상대 경로}}
+    """
+    try:
+        jobs, errors = store_chart_jobs(store_ids)
+        if errors:
+            raise ValueError("; ".join(f"{store_id}: {message}" for store_id, message in errors.items()))
+
+        results, render_errors = render_charts(jobs)
+        if render_errors:
+            raise RuntimeError(", ".join(render_errors.values()))
+
+        images = {}
+        for (store_id, job_key), relative_path in results.items():
+            images.setdefault(store_id, {})[job_key] = relative_path
+        return images
+
+    except Exception as e:
+        raise RuntimeError(f"데이터 시각화 중 오류 발생: {e}")
+
+
+def hash_chart_input(hasher, value):
+    """
+    차트 입력 데이터(DataFrame, Series, dict, 스칼라)를 해시에 반영
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        labels = list(value.columns) if isinstance(value, pd.DataFrame) else [value.name]
+        hasher.update(repr((type(value).__name__, labels, value.index.name)).encode('utf-8'))
+        hasher.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, dict):
+        for key in sorted(value):
+            hasher.update(repr(key).encode('utf-8'))
+            hash_chart_input(hasher, value[key])
+    else:
+        hasher.update(repr(value).encode('utf-8'))
+
+
+def chart_cache_key(name, data, params):
+    """
+    차트 이름, 입력 데이터, 렌더링 파라미터로 캐시 키 생성
+    """
+    hasher = hashlib.sha256()
+    hash_chart_input(hasher, (name, CHART_STYLE_VERSION))
+    hash_chart_input(hasher, data)
+    hash_chart_input(hasher, params)
+    return hasher.hexdigest()[:20]
+
+
+def prune_chart_versions(name, keep=CHART_VERSIONS_TO_KEEP, ext='png'):
+    """
+    같은 차트의 오래된 버전 파일 정리
+    최근 keep개는 항상 유지하고, 나머지는 마지막 사용(mtime) 후 CHART_VERSION_RETENTION이 지난 것만 삭제
+    """
+    versions = []
+    for path in glob.glob(os.path.join(CHART_FOLDER, f'{glob.escape(name)}-*.{ext}')):
+        try:
+            versions.append((os.path.getmtime(path), path))
+        except OSError:
+            pass
+    versions.sort(reverse=True)
+    expires_before = time.time() - CHART_VERSION_RETENTION
+    for modified, stale_path in versions[keep:]:
+        if modified >= expires_before:
+            continue
+        try:
+            os.remove(stale_path)
+        except OSError:
+            pass
+
+
+def touch_chart(path):
+    """
+    캐시된 차트 파일의 mtime을 갱신 (URL을 다시 내준 파일은 prune_chart_versions에서 최근 사용으로 취급)
+    """
+    try:
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+
+# 차트 렌더링 프로세스 풀 (최초 사용 시 생성 후 재사용)
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def warm_render_worker():
+    """
+    워커 프로세스 준비 (matplotlib import, 폰트 설정, 빈 차트 한 번 그리기)
+    """
+    warm_plotting()
+    return os.getpid()
+
+
+def get_render_pool():
+    """
+    미리 띄워 둔 차트 렌더링 프로세스 풀 반환 (CHART_RENDER_WORKERS가 0이면 None)
+    """
+    global _render_pool
+    if CHART_RENDER_WORKERS <= 0:
+        return None
+    with _render_pool_lock:
+        if _render_pool is None:
+            # spawn: 멀티스레드 Flask 프로세스를 fork하지 않음
+            _render_pool = ProcessPoolExecutor(
+                max_workers=CHART_RENDER_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+            for _ in range(CHART_RENDER_WORKERS):
+                _render_pool.submit(warm_render_worker)
+        return _render_pool
+
+
+def reset_render_pool():
+    """
+    고장 난 프로세스 풀을 정리 (다음 요청에서 새로 생성)
+    """
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown(wait=False, cancel_futures=True)
+            _render_pool = None
+
+
+def draw_chart_file(draw, data, output_path, params):
+    """
+    워커 프로세스에서 실행: 임시 경로에 차트 그리기
+    반환값: 단계별 소요 시간 목록 [(단계 이름, ms)] (render는 layout, save를 포함한 전체)
+    """
+    with collect_spans() as spans:
+        with span('render'):
+            draw(data, output_path, **params)
+    return spans
+
+
+def remove_temp_chart(temp_path):
+    """
+    렌더링에 실패한 임시 파일 삭제
+    """
+    try:
+        os.remove(temp_path)
+    except OSError:
+        pass
+
+
+def chart_filename(name, key, ext='png'):
+    """
+    차트 캐시 키로 정해지는 파일 이름 (렌더링 전에도 최종 URL을 알 수 있음)
+    """
+    return f'{name}-{key}.{ext}'
+
+
+def planned_chart_paths(jobs):
+    """
+    render_charts에 넘길 작업들이 만들 파일의 static 기준 상대 경로
+    """
+    return {
+        job_key: f'charts/{chart_filename(name, chart_cache_key(name, data, params))}'
+        for job_key, (name, draw, data, params) in jobs.items()
+    }
+
+
+def render_charts(jobs):
+    """
+    여러 차트를 프로세스 풀에서 동시에 렌더링
+    jobs: {결과 키: (차트 이름, draw 함수, 입력 데이터, 렌더링 파라미터)}
+    반환값: ({결과 키: static 기준 상대 경로}, {결과 키: 오류 메시지})
+    같은 키의 파일이 이미 있으면 다시 그리지 않음
+    """
+    results, errors, pending = {}, {}, {}
+    pool = get_render_pool()
+
+    for job_key, (name, draw, data, params) in jobs.items():
+        key = chart_cache_key(name, data, params)
+        filename = chart_filename(name, key)
+        output_path = os.path.join(CHART_FOLDER, filename)
+        if touch_chart(output_path):
+            increment_counter('chart_cache_hit')
+            results[job_key] = f'charts/{filename}'
+            continue
+        increment_counter('chart_cache_miss')
+
+        # 임시 파일에 그린 뒤 교체해 다른 요청이 그리다 만 파일을 받지 않게 함
+        temp_path = os.path.join(CHART_FOLDER, f'.{name}-{key}-{os.getpid()}-{threading.get_ident()}.png')
+        if pool is None:
+            try:
+                for stage, elapsed_ms in draw_chart_file(draw, data, temp_path, params):
+                    record_span(stage, elapsed_ms)
+                os.replace(temp_path, output_path)
+                prune_chart_versions(name)
+                results[job_key] = f'charts/{filename}'
+            except Exception as e:
+                errors[job_key] = str(e)
+                remove_temp_chart(temp_path)
+            continue
+        pending[job_key] = (name, filename, temp_path, pool.submit(draw_chart_file, draw, data, temp_path, params))
+
+    broken = False
+    wait_started = time.perf_counter()
+    for job_key, (name, filename, temp_path, future) in pending.items():
+        try:
+            # 워커에서 측정한 단계 시간을 이 요청에 반영
+            for stage, elapsed_ms in future.result(timeout=CHART_RENDER_TIMEOUT):
+                record_span(stage, elapsed_ms)
+            os.replace(temp_path, os.path.join(CHART_FOLDER, filename))
+            prune_chart_versions(name)
+            results[job_key] = f'charts/{filename}'
+        except BrokenProcessPool as e:
+            broken = True
+            errors[job_key] = f"렌더링 워커 오류: {e}"
+            remove_temp_chart(temp_path)
+        except Exception as e:
+            errors[job_key] = str(e) or type(e).__name__
+            remove_temp_chart(temp_path)
+
+    if pending:
+        record_span('render_wait', (time.perf_counter() - wait_started) * 1000)
+    if broken:
+        increment_counter('render_pool_broken')
+        reset_render_pool()
+    return results, errors
+
+
+_render_jobs = {}
+_render_jobs_by_key = {}
+_render_jobs_lock = threading.Lock()
+_render_job_queue = queue.Queue()
+_render_job_threads = []
+
+
+def render_job_worker():
+    """
+    작업 큐 스레드: 대기 중인 렌더링 작업을 하나씩 꺼내 실행
+    """
+    while True:
+        job_id = _render_job_queue.get()
+        with _render_jobs_lock:
+            job = _render_jobs[job_id]
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+            task = job.pop('task')
+        try:
+            results, errors = task()
+            status = 'done' if results else 'failed'
+        except Exception as e:
+            results, errors, status = {}, {'job': str(e) or type(e).__name__}, 'failed'
+
+        with _render_jobs_lock:
+            job['errors'].update(errors)
+            job['results'] = results
+            job['status'] = status
+            job['finished_at'] = time.time()
+            # 완료 후 같은 요청은 새 작업으로 (파일이 이미 있으면 캐시에서 바로 끝남)
+            if _render_jobs_by_key.get(job['key']) == job_id:
+                del _render_jobs_by_key[job['key']]
+        observe_metric('render_job', (job['finished_at'] - job['created_at']) * 1000)
+        increment_counter(f'render_job_{status}')
+        _render_job_queue.task_done()
+
+
+def start_render_job_threads():
+    """
+    작업 큐 스레드를 처음 필요할 때 띄움
+    """
+    with _render_jobs_lock:
+        while len(_render_job_threads) < max(1, RENDER_JOB_THREADS):
+            thread = threading.Thread(target=render_job_worker, name='render-job', daemon=True)
+            thread.start()
+            _render_job_threads.append(thread)
+
+
+def prune_render_jobs(now):
+    """
+    보관 시간이 지난 완료 작업 삭제 (_render_jobs_lock 안에서 호출)
+    """
+    expired = [
+        job_id for job_id, job in _render_jobs.items()
+        if job.get('finished_at') is not None and now - job['finished_at'] > RENDER_JOB_TTL
+    ]
+    for job_id in expired:
+        del _render_jobs[job_id]
+
+
+def submit_render_job(key, task, outputs, errors=None):
+    """
+    렌더링 작업을 큐에 넣고 작업 ID 반환
+    key: 같은 결과를 만드는 요청을 묶는 키 (대기/실행 중인 같은 키의 작업이 있으면 그 작업을 반환)
+    task: () -> ({결과 키: static 상대 경로}, {결과 키: 오류 메시지})
+    outputs: 작업이 끝나면 생길 {결과 키: static 상대 경로}
+    errors: 작업 전에 이미 실패한 결과 키의 오류 메시지
+    """
+    start_render_job_threads()
+    now = time.time()
+    with _render_jobs_lock:
+        prune_render_jobs(now)
+        job_id = _render_jobs_by_key.get(key)
+        if job_id is not None:
+            increment_counter('render_job_coalesced')
+            return job_id
+
+        job_id = uuid.uuid4().hex
+        _render_jobs[job_id] = {
+            'key': key,
+            'status': 'queued',
+            'task': task,
+            'outputs': outputs,
+            'results': {},
+            'errors': dict(errors or {}),
+            'created_at': now,
+            'started_at': None,
+            'finished_at': None,
+        }
+        _render_jobs_by_key[key] = job_id
+    _render_job_queue.put(job_id)
+    return job_id
+
+
+def render_job_body(job_id):
+    """
+    작업 상태 응답 본문 (없는 작업이면 LookupError)
+    이미지 URL은 작업이 끝나기 전에도 최종 주소로 채우고, 실패한 결과 키만 null
+    """
+    with _render_jobs_lock:
+        job = _render_jobs.get(job_id)
+        if job is None:
+            raise LookupError(f"작업을 찾을 수 없습니다: {job_id}")
+        finished = job['finished_at'] is not None
+        body = {
+            "jobId": job_id,
+            "status": job['status'],
+            "statusUrl": f"{BASE_URL}/api/jobs/{job_id}",
+        }
+        for job_key, relative_path in job['outputs'].items():
+            failed = job_key in job['errors'] or (finished and job_key not in job['results'])
+            body[job_key] = None if failed else chart_url(relative_path)
+        if job['errors']:
+            body["errors"] = dict(job['errors'])
+        body["queuedSeconds"] = round((job['started_at'] or time.time()) - job['created_at'], 3)
+        if finished:
+            body["elapsedSeconds"] = round(job['finished_at'] - job['created_at'], 3)
+    return body
+
+
+def wants_async_render():
+    """
+    작업 모드 요청 여부 (?async=1 또는 Prefer: respond-async 헤더)
+    """
+    if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+
+def accepted_job_response(job_id):
+    """
+    작업 모드 응답: 202 Accepted와 작업 상태 URL
+    """
+    response = make_response(jsonify(render_job_body(job_id)), 202)
+    response.headers['Location'] = f"{BASE_URL}/api/jobs/{job_id}"
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def json_error(message, status=500, **fields):
+    """
+    한글이 깨지지 않는 JSON 오류 응답 생성 (fields는 본문에 함께 넣을 값)
+    """
+    return Response(
+        json.dumps({"error": message, **fields}, ensure_ascii=False),
+        content_type="application/json; charset=utf-8",
+        status=status,
+    )
+
+
+def chart_url(relative_path):
+    """
+    static 상대 경로를 클라이언트용 이미지 URL로 변환
+    """
+    return f"{BASE_URL}/static/{relative_path}"
+
+
+CALMCAFE_IMAGE_KEYS = (
+    "genderImageUrl", "ageImageUrl", "menuImageUrl",
+    "busiestAndLeastBusyImageUrl", "averageCongestionImageUrl",
+    "genderDistributionImageUrl", "ageDistributionImageUrl",
+)
+
+
+def calmcafe_chart_jobs(nearby=None):
+    """
+    대시보드 차트의 렌더링 작업 목록
+    반환값: ({결과 키: (차트 이름, draw 함수, 입력 데이터, 파라미터)}, {결과 키: 데이터 준비 오류})
+    """
+    jobs, errors = {}, {}
+
+    # 타겟 카페의 성별, 연령대, 선호 메뉴 분포
+    try:
+        gender_counts, age_counts, favorite_menu_counts = target_store_distributions(TARGET_STORE_ID)
+        jobs["genderImageUrl"] = ('gender_distribution_target_store', draw_target_gender, gender_counts, {})
+        jobs["ageImageUrl"] = ('age_distribution_target_store', draw_target_age, age_counts, {})
+        jobs["menuImageUrl"] = ('favorite_menu_distribution_target_store', draw_target_menu, favorite_menu_counts, {})
+    except Exception as e:
+        for job_key in ("genderImageUrl", "ageImageUrl", "menuImageUrl"):
+            errors[job_key] = f"데이터 시각화 중 오류 발생: {e}"
+
+    # 요일별 가장 붐비는 시간대와 평균 혼잡도
+    try:
+        summary = congestion_summary_data()
+        jobs["busiestAndLeastBusyImageUrl"] = ('busiest_and_least_busy', draw_busiest_and_least_busy, summary, {})
+        jobs["averageCongestionImageUrl"] = ('average_congestion', draw_average_congestion, summary, {})
+    except Exception as e:
+        errors["busiestAndLeastBusyImageUrl"] = errors["averageCongestionImageUrl"] = f"혼잡도 계산 오류: {e}"
+
+    # 주변 카페 성별 및 연령대 분포
+    for job_key, name, data_fn, draw in (
+        ("genderDistributionImageUrl", 'gender_distribution', gender_distribution_data, draw_gender_distribution),
+        ("ageDistributionImageUrl", 'age_distribution', age_distribution_data, draw_age_distribution),
+    ):
+        try:
+            data = data_fn(nearby)
+            if data.empty:
+                raise ValueError("분포 데이터가 부족합니다.")
+            jobs[job_key] = (name, draw, data, {})
+        except Exception as e:
+            errors[job_key] = str(e)
+
+    return jobs, errors
+
+
+@app.route('/api/get-calmcafe-data-image', methods=['GET'])
+def get_target_store_visualization():
+    errors = {}
+    try:
+        # 주변 카페 필터 (lat, lon, radius가 있으면 반경 기준, 없으면 경기도)
+        try:
+            nearby = parse_nearby_args(request.args)
+        except ValueError as e:
+            return json_error(str(e), status=400)
+
+        jobs, errors = calmcafe_chart_jobs(nearby)
+
+        # 작업 모드: 아직 없는 차트가 있으면 큐에 넣고 최종 URL과 작업 ID를 바로 반환
+        if wants_async_render() and jobs:
+            outputs = planned_chart_paths(jobs)
+            missing = [path for path in outputs.values() if not os.path.exists(os.path.join(STATIC_FOLDER, path))]
+            if missing:
+                # 같은 차트 파일을 만드는 동시 요청은 하나의 작업으로 묶음
+                key = hashlib.sha256(
+                    json.dumps([outputs, sorted(errors)], sort_keys=True).encode('utf-8')
+                ).hexdigest()
+                job_id = submit_render_job(key, lambda: render_charts(jobs), outputs, errors)
+                return accepted_job_response(job_id)
+
+        # 입력이 바뀐 차트만 프로세스 풀에서 동시에 렌더링
+        results, render_errors = render_charts(jobs)
+        errors.update(render_errors)
+
+        if not results:
+            raise ValueError("모든 시각화 이미지를 생성하는 데 실패했습니다.")
+
+        # 모든 이미지 URL 반환 (실패한 차트는 null, 오류는 errors에 차트별로 기록)
+        body = {
+            job_key: chart_url(results[job_key]) if job_key in results else None
+            for job_key in CALMCAFE_IMAGE_KEYS
+        }
+        if errors:
+            body["errors"] = errors
+        return jsonify(body)
+
+    except Exception as e:
+        return json_error(f"시각화 오류: {str(e)}", errors=errors)
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_render_job(job_id):
+    """
+    API to return the status and eventual image URLs of an asynchronous render job.
+    """
+    try:
+        body = render_job_body(job_id)
+    except LookupError as e:
+        return json_error(str(e), status=404)
+
+    response = make_response(jsonify(body))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+
+@app.route('/api/nearby', methods=['GET'])
+def get_nearby_stores():
+    """
+    API to return cafes within a radius (km) of a point, ranked by favorites and current congestion.
+    """
+    try:
+        nearby = parse_nearby_args(request.args)
+        if nearby is None:
+            raise ValueError("lat과 lon이 필요합니다.")
+        try:
+            limit = int(request.args.get('limit', NEARBY_DEFAULT_LIMIT))
+        except ValueError:
+            raise ValueError("limit은 정수여야 합니다.")
+        if not 1 <= limit <= NEARBY_MAX_LIMIT:
+            raise ValueError(f"limit은 1~{NEARBY_MAX_LIMIT} 사이여야 합니다.")
+    except ValueError as e:
+        return json_error(str(e), status=400)
+
+    try:
+        results = query_nearby_stores(*nearby, limit=limit)[
+            ['store_id', 'name', 'address', 'distance_km', 'favorite_count',
+             'store_congestion_level', 'store_congestion_value']
+        ].to_dict(orient='records')
+        return jsonify(results)
+
+    except Exception as e:
+        return json_error(str(e))
+
+
+@app.route('/api/stores/<int:store_id>/congestion', methods=['GET'])
+def get_store_congestion(store_id):
+    """
+    API to return busiest/calmest and average congestion chart URLs for a store.
+    """
+    try:
+        summary = congestion_summary_data(store_id)
+    except LookupError as e:
+        return json_error(str(e), status=404)
+
+    try:
+        results, errors = render_charts({
+            "busiestAndLeastBusyImageUrl": (
+                f'busiest_and_least_busy_{store_id}', draw_busiest_and_least_busy, summary, {}
+            ),
+            "averageCongestionImageUrl": (
+                f'average_congestion_{store_id}', draw_average_congestion, summary, {}
+            ),
+        })
+        if errors:
+            raise RuntimeError(", ".join(errors.values()))
+
+        return jsonify({
+            "storeId": store_id,
+            "busiestAndLeastBusyImageUrl": chart_url(results["busiestAndLeastBusyImageUrl"]),
+            "averageCongestionImageUrl": chart_url(results["averageCongestionImageUrl"]),
+        })
+
+    except Exception as e:
+        return json_error(f"시각화 오류: {str(e)}")
+
+
+def parse_congestion_stats_args(args):
+    """
+    요청 파라미터 percentiles(쉼표 구분, 0~100), window(시간, 1~24)를 변환
+    """
+    try:
+        percentiles = tuple(
+            float(part) for part in args.get('percentiles', ','.join(map(str, CONGESTION_PERCENTILES))).split(',')
+            if part.strip()
+        )
+        window_hours = int(args.get('window', CONGESTION_WINDOW_HOURS))
+    except ValueError:
+        raise ValueError("percentiles는 쉼표로 구분한 숫자, window는 정수여야 합니다.")
+    if any(not 0 <= q <= 100 for q in percentiles):
+        raise ValueError("percentiles는 0~100 사이여야 합니다.")
+    if not 1 <= window_hours <= CONGESTION_HOURS:
+        raise ValueError(f"window는 1~{CONGESTION_HOURS} 사이여야 합니다.")
+    return tuple(int(q) if q.is_integer() else q for q in percentiles), window_hours
+
+
+@app.route('/api/stores/<int:store_id>/congestion/stats', methods=['GET'])
+def get_store_congestion_stats(store_id):
+    """
+    API to return busiest/calmest hours, means, percentiles and the calmest N-hour window as JSON (no charts).
+    """
+    try:
+        percentiles, window_hours = parse_congestion_stats_args(request.args)
+    except ValueError as e:
+        return json_error(str(e), status=400)
+
+    try:
+        return jsonify(congestion_statistics(store_id, percentiles, window_hours))
+    except LookupError as e:
+        return json_error(str(e), status=404)
+    except Exception as e:
+        return json_error(str(e))
+
+
+@app.route('/api/stores/<int:store_id>/profile', methods=['GET'])
+def get_store_profile(store_id):
+    """
+    API to return the gender/age group/favorite menu profile of users who favorited a store, with favorites per (gender, age group, menu) segment, as JSON (no charts).
+    """
+    try:
+        return jsonify(store_profile(store_id))
+    except LookupError as e:
+        return json_error(str(e), status=404)
+    except Exception as e:
+        return json_error(str(e))
+
+
+@app.route('/api/stores/<int:store_id>/forecast', methods=['GET'])
+def get_store_forecast(store_id):
+    """
+    API to return the expected congestion for each upcoming hour (?hours=1~24) and the next calm slot.
+    """
+    try:
+        hours = int(request.args.get('hours', FORECAST_HOURS))
+    except ValueError:
+        return json_error("hours는 정수여야 합니다.", status=400)
+    if not 1 <= hours <= FORECAST_HOURS:
+        return json_error(f"hours는 1~{FORECAST_HOURS} 사이여야 합니다.", status=400)
+
+    try:
+        return jsonify(store_forecast(store_id, hours))
+    except LookupError as e:
+        return json_error(str(e), status=404)
+    except Exception as e:
+        return json_error(str(e))
+
+
+def parse_event_int(body, key, required=True):
+    """
+    JSON 요청 본문의 정수 항목 (없으면 None, 정수가 아니면 ValueError)
+    """
+    value = body.get(key)
+    if value is None:
+        if required:
+            raise ValueError(f"{key}가 필요합니다.")
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"{key}는 정수여야 합니다.")
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{key}는 정수여야 합니다.")
+
+
+@app.route('/api/favorites', methods=['POST'])
+def post_favorite():
+    """
+    API to append a favorite (store_id, user_id) and update rankings and per-store distributions incrementally.
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        store_id = parse_event_int(body, 'store_id')
+        user_id = parse_event_int(body, 'user_id')
+    except ValueError as e:
+        return json_error(str(e), status=400)
+
+    try:
+        if store_id not in get_id_index()['store_ids']:
+            return json_error(f"카페를 찾을 수 없습니다: {store_id}", status=404)
+
+        record_favorites_event(
+            store_favorite_path,
+            {'store_id': store_id, 'user_id': user_id},
+            lambda ids, index: apply_favorite_event(ids, index, store_id, user_id),
+        )
+        index = get_favorites_index()
+        favorite_count = int(index['favorite_counts'][index['store_ids'].get_loc(store_id)])
+        return jsonify({"storeId": store_id, "userId": user_id, "favoriteCount": favorite_count}), 201
+
+    except Exception as e:
+        return json_error(str(e))
+
+
+@app.route('/api/survey', methods=['POST'])
+def post_survey():
+    """
+    API to append a survey response and move the user's existing favorites to the new profile incrementally.
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        user_id = parse_event_int(body, 'user_id')
+        age = parse_event_int(body, 'age', required=False)
+        gender = body.get('gender')
+        if gender is not None and gender not in GENDER_LABELS:
+            raise ValueError(f"gender는 {', '.join(GENDER_LABELS)} 중 하나여야 합니다.")
+    except ValueError as e:
+        return json_error(str(e), status=400)
+
+    try:
+        # 설문 CSV의 다른 컬럼은 요청에 있으면 그대로 기록
+        row = {key: value for key, value in body.items() if isinstance(value, (str, int, float))}
+        row.update({'user_id': user_id, 'age': age, 'gender': gender})
+        profile = (
+            gender,
+            np.nan if age is None else age_group_of(age),
+            body.get('favorite_menu') or np.nan,
+        )
+        record_favorites_event(
+            user_data_path, row, lambda ids, index: apply_survey_event(ids, index, user_id, profile)
+        )
+        return jsonify({
+            "userId": user_id,
+            "favoriteStores": [int(store_id) for store_id in user_favorite_stores(get_id_index(), user_id)],
+        }), 201
+
+    except Exception as e:
+        return json_error(str(e))
+
+
+STORE_BATCH_MAX = 100
+
+
+def parse_store_ids(value, max_count=STORE_BATCH_MAX):
+    """
+    쉼표로 구분한 카페 id 목록 파싱 (중복 제거, 순서 유지, 최대 max_count개)
+    """
+    try:
+        store_ids = list(dict.fromkeys(int(part) for part in (value or '').split(',') if part.strip()))
+    except ValueError:
+        raise ValueError("ids는 쉼표로 구분한 정수 목록이어야 합니다.")
+    if not store_ids:
+        raise ValueError("ids가 필요합니다.")
+    if len(store_ids) > max_count:
+        raise ValueError(f"ids는 최대 {max_count}개까지 지정할 수 있습니다.")
+    return store_ids
+
+
+@app.route('/api/stores/favorites-images', methods=['GET'])
+def get_store_favorites_images():
+    """
+    API to return gender/age/menu chart URLs for several stores (?ids=1,2,3) computed in one pass.
+    """
+    try:
+        store_ids = parse_store_ids(request.args.get('ids'))
+    except ValueError as e:
+        return json_error(str(e), status=400)
+
+    try:
+        jobs, errors = store_chart_jobs(store_ids)
+        results, render_errors = render_charts(jobs)
+
+        # 데이터 오류는 카페 단위 메시지, 렌더링 오류는 카페별 {결과 키: 메시지}
+        stores, store_errors = {}, {str(store_id): message for store_id, message in errors.items()}
+        for (store_id, job_key), message in render_errors.items():
+            store_errors.setdefault(str(store_id), {})[job_key] = message
+        for store_id in store_ids:
+            if store_id in errors:
+                continue
+            stores[str(store_id)] = {
+                job_key: chart_url(results[(store_id, job_key)]) if (store_id, job_key) in results else None
+                for job_key, _, _ in STORE_IMAGE_CHARTS
+            }
+
+        body = {"stores": stores}
+        if store_errors:
+            body["errors"] = store_errors
+        return jsonify(body)
+
+    except Exception as e:
+        return json_error(f"시각화 오류: {str(e)}")
+
+
+def parse_occupancy_body(body):
+    """
+    점유 상태 갱신 요청 본문 변환 (인원은 0 이상, 혼잡도 값은 0~100, 하나 이상 필요)
+    """
+    fields = {
+        'current': 'current_customer_count',
+        'maximum': 'max_customer_count',
+        'store_value': 'store_congestion_value',
+        'user_value': 'user_congestion_value',
+    }
+    values = {name: parse_event_int(body, key, required=False) for name, key in fields.items()}
+    if all(value is None for value in values.values()):
+        raise ValueError(f"{', '.join(fields.values())} 중 하나 이상이 필요합니다.")
+    for name in ('current', 'maximum'):
+        if values[name] is not None and values[name] < 0:
+            raise ValueError(f"{fields[name]}는 0 이상이어야 합니다.")
+    for name in ('store_value', 'user_value'):
+        if values[name] is not None and not 0 <= values[name] <= 100:
+            raise ValueError(f"{fields[name]}는 0~100 사이여야 합니다.")
+    return values
+
+
+@app.route('/api/stores/<int:store_id>/occupancy', methods=['POST'])
+def post_store_occupancy(store_id):
+    """
+    API to update a store's live occupancy (customer counts, congestion values) in memory.
+    """
+    try:
+        values = parse_occupancy_body(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return json_error(str(e), status=400)
+
+    try:
+        update_occupancy(store_id, **values)
+        entries, _ = occupancy_entries([store_id])
+        return jsonify({"storeId": store_id, **entries[store_id]})
+    except LookupError as e:
+        return json_error(str(e), status=404)
+    except Exception as e:
+        return json_error(str(e))
+
+
+@app.route('/api/stores/occupancy', methods=['GET'])
+def get_stores_occupancy():
+    """
+    API to return live occupancy ratio and congestion level for many stores (?ids=1,2,3) from memory.
+    """
+    try:
+        store_ids = parse_store_ids(request.args.get('ids'), max_count=OCCUPANCY_BATCH_MAX)
+    except ValueError as e:
+        return json_error(str(e), status=400)
+
+    try:
+        entries, errors = occupancy_entries(store_ids)
+        body = {"stores": {str(store_id): entry for store_id, entry in entries.items()}}
+        if errors:
+            body["errors"] = {str(store_id): message for store_id, message in errors.items()}
+        response = make_response(jsonify(body))
+
+        # ETag는 응답 본문의 해시 (워커마다 메모리 상태가 달라도 같은 본문일 때만 304)
+        etag = hashlib.sha256(response.get_data()).hexdigest()[:20]
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    except Exception as e:
+        return json_error(str(e))
+
+
+@app.route('/api/_metrics', methods=['GET'])
+def get_metrics():
+    """
+    API to return per-stage latency histograms and counters for this worker process.
+    """
+    response = make_response(jsonify(metrics_snapshot()))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+# static 디렉토리의 파일을 클라이언트가 접근할 수 있게 설정
+@app.route('/static/<path:filename>')
+def serve_static(filename):
+    if filename.startswith('charts/'):
+        # 내용 주소 기반 차트: 파일 이름의 해시를 강한 ETag로 사용하고 장기 캐시 허용
+        key = os.path.splitext(filename)[0].rsplit('-', 1)[-1]
+        response = send_from_directory(STATIC_FOLDER, filename, etag=key, max_age=CHART_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    # 고정 이름 파일은 덮어쓰일 수 있으므로 매번 ETag로 재검증
+    response = send_from_directory(STATIC_FOLDER, filename, etag=True)
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/favicon.ico')
+def favicon():
+    return '', 404  # 빈 응답을 반환하여 404 오류 처리
+
+
+def preload(start_workers=True):
+    """
+    워커가 요청을 받기 전에 무거운 의존성과 데이터를 미리 준비 (gunicorn post_worker_init 등에서 호출)
+    plotting: matplotlib import, 폰트 캐시, 빈 차트 렌더링 / ranking_font: PIL 폰트와 캔버스
+    datasets: 데이터셋과 집계 인덱스 / occupancy: 실시간 점유 상태 / forecast: 혼잡도 예측 테이블
+    render_pool: 렌더링 워커 프로세스 기동과 준비 대기, 예측 스레드 시작
+    start_workers가 False면 프로세스 풀과 스레드는 만들지 않고 데이터만 준비
+    (import 시점용: 모듈 import 중에는 워커가 이 모듈을 불러올 수 없고, gunicorn --preload로 fork하면
+    부모의 풀과 스레드는 자식에서 동작하지 않음)
+    반환값: 단계별 소요 시간(초)과 import 시작부터의 콜드 스타트 시간 (실패한 단계는 errors에 기록)
+    """
+    timings, errors = {}, {}
+
+    def step(name, fn):
+        started = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            errors[name] = str(e)
+        timings[name] = round(time.perf_counter() - started, 3)
+
+    def warm_render_pool():
+        pool = get_render_pool()
+        if pool is not None:
+            for future in [pool.submit(warm_render_worker) for _ in range(CHART_RENDER_WORKERS)]:
+                future.result(timeout=CHART_RENDER_TIMEOUT)
+
+    step('plotting', warm_plotting)
+    step('ranking_font', lambda: ranking_font(RANKING_FONT_SIZE))
+    if RANKING_API_URL:
+        step('requests', lambda: importlib.import_module('requests'))
+    step('datasets', lambda: (get_favorites_index(), get_spatial_index(), get_congestion_index()))
+    step('occupancy', lambda: occupancy_entries([]))
+    step('forecast', get_forecast if start_workers else refresh_forecast)
+    if start_workers:
+        step('render_pool', warm_render_pool)
+
+    report = {
+        'steps': timings,
+        'preload_s': round(sum(timings.values()), 3),
+        'cold_start_s': round(time.perf_counter() - IMPORT_STARTED, 3),
+    }
+    if errors:
+        report['errors'] = errors
+    _startup['preload'] = report
+    print(
+        f"preload 완료: 콜드 스타트 {report['cold_start_s']:.2f}초 "
+        f"(import {_startup['import_s']:.2f}초, "
+        + ", ".join(f"{name} {elapsed:.2f}초" for name, elapsed in timings.items()) + ")"
+    )
+    for name, message in errors.items():
+        print(f"preload {name} 오류: {message}")
+    return report
+
+
+def reset_after_fork():
+    """
+    fork된 자식 프로세스에서 부모의 렌더링 풀, 작업 큐, 백그라운드 스레드 상태를 버림
+    (부모의 스레드는 자식에 없으므로 다음 사용 시 새로 만듦)
+    fork 시점에 부모의 다른 스레드가 잡고 있던 잠금은 자식에서 영원히 풀리지 않으므로
+    모듈 수준 잠금(threading.Lock)은 모두 새로 생성
+    """
+    global _render_pool, _render_jobs, _render_jobs_by_key, _render_job_queue, _forecast_wakeup
+
+    lock_type = type(threading.Lock())
+    module_globals = globals()
+    for name, value in list(module_globals.items()):
+        if isinstance(value, lock_type):
+            module_globals[name] = threading.Lock()
+
+    _render_pool = None
+    _render_jobs, _render_jobs_by_key = {}, {}
+    _render_job_queue = queue.Queue()
+    _render_job_threads.clear()
+    _forecast_wakeup = threading.Event()
+    _forecast_threads.clear()
+    _occupancy_threads.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+
+_startup['import_s'] = round(time.perf_counter() - IMPORT_STARTED, 3)
+
+# PRELOAD=1이면 import 시점에 데이터만 준비 (렌더링 워커 등 multiprocessing 자식 프로세스에서는 생략)
+if os.getenv("PRELOAD", "0") == "1" and multiprocessing.parent_process() is None:
+    preload(start_workers=False)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)